@@ -19,7 +19,8 @@ def get_redis_pool():
             host=settings.REDIS_HOST,
             port=settings.REDIS_PORT,
             db=settings.REDIS_DB,
-            decode_responses=True,
+            # Cache values are versioned binary blobs (see app.services.serialization)
+            decode_responses=False,
             max_connections=50,  # Adjust based on your concurrency needs
         )
     return _redis_pool
@@ -1,20 +1,33 @@
 import time
-from typing import Union
+from typing import Union, TYPE_CHECKING
 
 import torch
 from PIL import Image
-from transformers import BlipProcessor, BlipForConditionalGeneration, Blip2Processor, Blip2ForConditionalGeneration, \
-    Gemma3Processor, Gemma3ForConditionalGeneration, InternVLProcessor, InternVLForConditionalGeneration
 
-from app.models.gemma import DEFAULT_GEMMA_PROMPT
+from app.inference.generation import generate, generate_scored, generation_preset, model_family, is_vlm, VLM_FAMILIES
+from app.inference.preprocessing import preprocess_images, supports_batched_preprocessing
+from app.prompts import DEFAULT_PROMPTS
+from app.services.optimization import execution_context
 
+# Only import these for type checking; model classes are imported by the loaders in app.models
+if TYPE_CHECKING:
+    from transformers import BlipProcessor, BlipForConditionalGeneration, Blip2Processor, \
+        Blip2ForConditionalGeneration, Gemma3Processor, Gemma3ForConditionalGeneration, InternVLProcessor, \
+        InternVLForConditionalGeneration
 
-def infer_image_caption(processor: Union[BlipProcessor, Blip2Processor, Gemma3Processor, InternVLProcessor],
-                        model: Union[BlipForConditionalGeneration, Blip2ForConditionalGeneration,
-                        Gemma3ForConditionalGeneration, InternVLForConditionalGeneration],
-                        device: str, image: Image.Image, optional_caption_prompt: str = None):
+DEFAULT_GEMMA_PROMPT = DEFAULT_PROMPTS.get("gemma").get("caption_prompt")
+
+
+def infer_image_caption(processor: 'Union[BlipProcessor, Blip2Processor, Gemma3Processor, InternVLProcessor]',
+                        model: 'Union[BlipForConditionalGeneration, Blip2ForConditionalGeneration, '
+                               'Gemma3ForConditionalGeneration, InternVLForConditionalGeneration]',
+                        device: str, image: Image.Image, optional_caption_prompt: str = None,
+                        image_key: str = None, max_new_tokens: int = None, return_confidence: bool = False):
+    """Caption a single image; with ``return_confidence`` returns ``(caption, confidence)`` instead."""
     start_time = time.time()
-    if isinstance(model, Gemma3ForConditionalGeneration) or isinstance(model, InternVLForConditionalGeneration):
+    confidence = None
+    family = model_family(model)
+    if family in VLM_FAMILIES:
         """Run Gemma or Intern VLM inference on a single image and return the caption."""
         messages = [
             {
@@ -39,37 +52,109 @@ def infer_image_caption(processor: Union[BlipProcessor, Blip2Processor, Gemma3Pr
             return_tensors="pt",
             add_generation_prompt=True,
         ).to(model.device)
-        output = model.generate(**inputs, max_new_tokens=50, cache_implementation="static")
+        preset = generation_preset(model, "caption", max_new_tokens=max_new_tokens)
+        if return_confidence:
+            output, (confidence,) = generate_scored(model, inputs, processor, [image_key] if image_key else None,
+                                                    **preset)
+        else:
+            output = generate(model, inputs, processor, [image_key] if image_key else None, **preset)
         caption = processor.decode(output[0][inputs["input_ids"].shape[-1]:], skip_special_tokens=True)
         end_time = time.time()
-    elif isinstance(model, (BlipForConditionalGeneration, Blip2ForConditionalGeneration)):
+    elif family in {"blip", "blip2"}:
         """Run BLIP inference on a single image and return the caption."""
 
-        if optional_caption_prompt:
-            inputs = processor(images=image, text=optional_caption_prompt, return_tensors="pt").to(device)
-        else:
-            inputs = processor(image, return_tensors="pt").to(device)
-
-        with torch.no_grad():
-            generated_ids = model.generate(**inputs)
-            caption = processor.batch_decode(generated_ids, skip_special_tokens=True)[0].strip()
-            # Remove the optional caption prefix if it was used
-            if optional_caption_prompt and caption.lower().startswith(optional_caption_prompt.lower()):
-                caption = caption.replace(optional_caption_prompt, '').strip()
+        inputs = _blip_inputs(processor, model, device, [image], optional_caption_prompt)
+
+        with execution_context(model):
+            preset = generation_preset(model, "caption", max_new_tokens=max_new_tokens)
+            if return_confidence:
+                generated_ids, (confidence,) = generate_scored(model, inputs, processor,
+                                                               [image_key] if image_key else None, **preset)
+            else:
+                generated_ids = generate(model, inputs, processor, [image_key] if image_key else None, **preset)
+            caption = _decode_blip(processor, generated_ids, optional_caption_prompt)[0]
             end_time = time.time()
     else:
         raise ValueError("Unsupported model type for inference.")
     print(f"Generated Caption: {caption}")
     print(f"Time taken for inference: {end_time - start_time} s")
+    if return_confidence:
+        return caption, confidence
     return caption
 
 
-def infer_collective_caption(processor: Union[Gemma3Processor, InternVLProcessor],
-                             model: Union[Gemma3ForConditionalGeneration, InternVLForConditionalGeneration],
+def infer_image_captions(processor: 'Union[BlipProcessor, Blip2Processor]',
+                         model: 'Union[BlipForConditionalGeneration, Blip2ForConditionalGeneration]',
+                         device: str, images: list[Image.Image], optional_caption_prompt: str = None,
+                         image_keys: list[str] | None = None, max_new_tokens: int = None,
+                         return_confidence: bool = False):
+    """Caption several images in one batched preprocess + generate call (BLIP / BLIP 2 only).
+
+    Returns one caption per image, in order; empty strings where the model produced nothing. With
+    ``return_confidence`` returns ``(captions, confidences)`` instead.
+    """
+    if model_family(model) not in {"blip", "blip2"}:
+        raise ValueError("Batched captioning is only supported for BLIP / BLIP 2 models.")
+    start_time = time.time()
+    inputs = _blip_inputs(processor, model, device, images, optional_caption_prompt)
+    preset = generation_preset(model, "caption", max_new_tokens=max_new_tokens)
+    with execution_context(model):
+        if return_confidence:
+            generated_ids, confidences = generate_scored(model, inputs, processor, image_keys, **preset)
+        else:
+            generated_ids = generate(model, inputs, processor, image_keys, **preset)
+    captions = _decode_blip(processor, generated_ids, optional_caption_prompt)
+    print(f"Generated Captions: {captions}")
+    print(f"Time taken for batched inference: {time.time() - start_time} s (images={len(images)})")
+    if return_confidence:
+        return captions, confidences
+    return captions
+
+
+def _blip_inputs(processor, model, device: str, images: list[Image.Image], optional_caption_prompt: str = None):
+    if model_family(model) == "blip" and supports_batched_preprocessing(processor):
+        # Pixels go through the batched tensor path; the prompt is tokenized as usual
+        inputs = {"pixel_values": preprocess_images(processor, images, device, getattr(model, "dtype", torch.float32))}
+        if optional_caption_prompt:
+            # BlipProcessor drops token_type_ids; BLIP's generate rejects them as unused model kwargs
+            inputs.update(processor.tokenizer([optional_caption_prompt] * len(images), return_token_type_ids=False,
+                                              return_tensors="pt").to(device))
+        return inputs
+    if optional_caption_prompt:
+        return processor(images=images, text=[optional_caption_prompt] * len(images), return_tensors="pt").to(device)
+    return processor(images, return_tensors="pt").to(device)
+
+
+def _decode_blip(processor, generated_ids, optional_caption_prompt: str = None) -> list[str]:
+    captions = []
+    for caption in processor.batch_decode(generated_ids, skip_special_tokens=True):
+        caption = caption.strip()
+        # Remove the optional caption prefix if it was used
+        if optional_caption_prompt and caption.lower().startswith(optional_caption_prompt.lower()):
+            caption = caption.replace(optional_caption_prompt, '').strip()
+        captions.append(caption)
+    return captions
+
+
+def caption_quality(caption: str) -> float:
+    """Cheap 0..1 plausibility score for a caption: penalises empty, very short and repetitive outputs."""
+    words = caption.lower().split() if caption else []
+    if not words:
+        return 0.0
+    # Degenerate decodes repeat themselves ("a a a a", "a dog a dog a dog")
+    distinct = len(set(words)) / len(words)
+    length = min(len(words), 4) / 4
+    return distinct * length
+
+
+def infer_collective_caption(processor: 'Union[Gemma3Processor, InternVLProcessor]',
+                             model: 'Union[Gemma3ForConditionalGeneration, InternVLForConditionalGeneration]',
                              device: str,
                              images: list[Image.Image],
                              optional_caption_prompt: str = None,
-                             max_new_tokens: int = 80) -> str:
+                             max_new_tokens: int = None,
+                             known_captions: list[str | None] | None = None,
+                             image_keys: list[str] | None = None) -> str:
     """Generate a single caption that describes a collection of images (Gemma / InternVLM only).
 
     Parameters
@@ -79,14 +164,17 @@ def infer_collective_caption(processor: Union[Gemma3Processor, InternVLProcessor
     device : str (unused directly but kept for interface symmetry)
     images : list[PIL.Image]
     optional_caption_prompt : Optional str prompt instruction
-    max_new_tokens : generation length cap
+    max_new_tokens : generation length cap (defaults to the "collective" generation preset)
+    known_captions : Optional per-image short captions aligned with ``images``; images with a caption are
+        described to the model as text instead of being passed through the vision encoder
+    image_keys : Optional sha256 per image (aligned with ``images``) used to reuse cached vision features
 
     Returns
     -------
     str : Collective caption
     """
     print(f"Running collective captioning on {len(images)} images using device: {device}")
-    if not isinstance(model, (Gemma3ForConditionalGeneration, InternVLForConditionalGeneration)):
+    if not is_vlm(model):
         raise ValueError("Collection captioning is only supported for Gemma / InternVLM models.")
 
     start_time = time.time()
@@ -96,10 +184,20 @@ def infer_collective_caption(processor: Union[Gemma3Processor, InternVLProcessor
     user_instruction = (
         "Provide a single holistic caption (<= 25 words) that best summarizes the full set of images."
     )
+    if known_captions is None:
+        image_content = [{"type": "image", "image": img} for img in images]
+    else:
+        if image_keys is not None:
+            # Only images that still go through the vision encoder keep their key
+            image_keys = [k for k, known in zip(image_keys, known_captions) if not known]
+        # Keep client order; seen images become one short text line each
+        image_content = [
+            {"type": "text", "text": f"Image {i + 1}: {known}"} if known else {"type": "image", "image": img}
+            for i, (img, known) in enumerate(zip(images, known_captions))
+        ]
     messages = [
         {"role": "system", "content": [{"type": "text", "text": system_text}]},
-        {"role": "user", "content": ([{"type": "image", "image": img} for img in images] +
-                                     [{"type": "text", "text": user_instruction}])}
+        {"role": "user", "content": image_content + [{"type": "text", "text": user_instruction}]}
     ]
     inputs = processor.apply_chat_template(
         messages,
@@ -109,7 +207,8 @@ def infer_collective_caption(processor: Union[Gemma3Processor, InternVLProcessor
         add_generation_prompt=True,
     ).to(model.device)
 
-    output = model.generate(**inputs, max_new_tokens=max_new_tokens, cache_implementation="static")
+    output = generate(model, inputs, processor, image_keys,
+                      **generation_preset(model, "collective", max_new_tokens=max_new_tokens))
     caption = processor.decode(output[0][inputs["input_ids"].shape[-1]:], skip_special_tokens=True).strip()
     end_time = time.time()
     print(f"Generated Collective Caption: {caption}")
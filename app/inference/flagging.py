@@ -1,21 +1,31 @@
 import json
 import re
 import time
-from typing import Union
+from typing import Union, TYPE_CHECKING
 
 from PIL import Image
-from transformers import Gemma3Processor, Gemma3ForConditionalGeneration, InternVLProcessor, \
-    InternVLForConditionalGeneration
 
-from app.models.gemma import DEFAULT_FLAG_GEMMA_PROMPT
+from app.inference.generation import generate, generation_preset, forward_logits, append_tokens, is_vlm
+from app.prompts import DEFAULT_PROMPTS
 
+# Only import these for type checking; model classes are imported by the loaders in app.models
+if TYPE_CHECKING:
+    from transformers import Gemma3Processor, Gemma3ForConditionalGeneration, InternVLProcessor, \
+        InternVLForConditionalGeneration
 
-def is_flagged(processor: Union[Gemma3Processor, InternVLProcessor],
-               model: Union[Gemma3ForConditionalGeneration, InternVLForConditionalGeneration],
+DEFAULT_FLAG_GEMMA_PROMPT = DEFAULT_PROMPTS.get("gemma").get("flag_caption_prompt")
+
+# Assistant-turn prefix forced before scoring; the next token decides the verdict
+FLAG_ANSWER_PREFIX = '{"flag":'
+
+
+def is_flagged(processor: 'Union[Gemma3Processor, InternVLProcessor]',
+               model: 'Union[Gemma3ForConditionalGeneration, InternVLForConditionalGeneration]',
                device: str,
                images: list[Image.Image],
                optional_flag_prompt: str = None,
-               max_new_tokens: int = 80) -> bool:
+               max_new_tokens: int = None,
+               image_keys: list[str] | None = None) -> bool:
     """Verify if any of the provided images were downloaded from the internet. Only supported for Gemma / InternVLM.
 
     Parameters
@@ -25,14 +35,15 @@ def is_flagged(processor: Union[Gemma3Processor, InternVLProcessor],
     device : str (unused directly but kept for interface symmetry)
     images : list[PIL.Image]
     optional_flag_prompt : Optional str prompt instruction
-    max_new_tokens : generation length cap
+    max_new_tokens : generation length cap (defaults to the "flag" generation preset)
+    image_keys : Optional sha256 per image (aligned with ``images``) used to reuse cached vision features
 
     Returns
     -------
     str : Collective caption
     """
     print(f"Running flag images using device: {device} with prompt: {optional_flag_prompt}")
-    if not isinstance(model, (Gemma3ForConditionalGeneration, InternVLForConditionalGeneration)):
+    if not is_vlm(model):
         raise ValueError("Collection captioning is only supported for Gemma / InternVLM models.")
 
     start_time = time.time()
@@ -55,7 +66,14 @@ def is_flagged(processor: Union[Gemma3Processor, InternVLProcessor],
         add_generation_prompt=True,
     ).to(model.device)
 
-    output = model.generate(**inputs, max_new_tokens=max_new_tokens, cache_implementation="static")
+    preset = generation_preset(model, "flag", max_new_tokens=max_new_tokens)
+    if preset.pop("mode", "generate") == "logits":
+        flagged = score_flag_logits(processor, model, inputs, image_keys)
+        print(f"Scored Flag (single forward pass): {flagged}")
+        print(f"Time taken for flag scoring: {time.time() - start_time} s (images={len(images)})")
+        return flagged
+
+    output = generate(model, inputs, processor, image_keys, **preset)
     json_response = processor.decode(output[0][inputs["input_ids"].shape[-1]:], skip_special_tokens=True).strip()
     end_time = time.time()
     print(f"\nGenerated JSON Response: {json_response}")
@@ -64,6 +82,21 @@ def is_flagged(processor: Union[Gemma3Processor, InternVLProcessor],
     return extract_flag_json(json_response)
 
 
+def score_flag_logits(processor, model, inputs, image_keys: list[str] | None = None) -> bool:
+    """Decide the flag from one forward pass: force the ``{"flag":`` prefix and compare `true` vs `false` logits."""
+    tokenizer = getattr(processor, "tokenizer", processor)
+    prefix_ids = tokenizer(FLAG_ANSWER_PREFIX, add_special_tokens=False, return_tensors="pt")["input_ids"]
+    logits = forward_logits(model, append_tokens(inputs, prefix_ids), processor, image_keys)[0]
+    true_ids = _first_token_ids(tokenizer, ("true", " true"))
+    false_ids = _first_token_ids(tokenizer, ("false", " false"))
+    return bool(logits[true_ids].max() > logits[false_ids].max())
+
+
+def _first_token_ids(tokenizer, variants: tuple[str, ...]) -> list[int]:
+    # With or without a leading space, depending on how the tokenizer merges it after the colon
+    return sorted({tokenizer(v, add_special_tokens=False)["input_ids"][0] for v in variants})
+
+
 def extract_flag_json(text: str):
     """
     Extracts and validates a JSON object with a 'flag' key from model output.
@@ -0,0 +1,179 @@
+import torch
+from transformers import StoppingCriteria, StoppingCriteriaList
+
+from app.presets import VLM_FAMILIES
+from app.services import static_cache
+from app.services.admission import current_ticket, Ticket
+from app.services.assisted import assisted_generate, can_assist
+from app.services.model_client import RemoteModel
+from app.services.optimization import execution_context
+from app.services.vision_cache import vision_cache_scope
+from app.settings import settings
+
+
+# Registry key per model class name; matched by name so the modeling modules are only imported by the loaders
+_FAMILIES_BY_CLASS = {
+    "Gemma3ForConditionalGeneration": "gemma",
+    "InternVLForConditionalGeneration": "intern_vlm",
+    "Blip2ForConditionalGeneration": "blip2",
+    "BlipForConditionalGeneration": "blip",
+}
+
+
+def model_family(model) -> str:
+    """Map a loaded model to its registry key (the key presets are configured under)."""
+    if isinstance(model, RemoteModel):
+        return model.family
+    for cls in type(model).__mro__:
+        if cls.__name__ in _FAMILIES_BY_CLASS:
+            return _FAMILIES_BY_CLASS[cls.__name__]
+    raise ValueError("Unsupported model type for inference.")
+
+
+class TicketStoppingCriteria(StoppingCriteria):
+    """Stop decoding between tokens once the request's client has gone away or its deadline has passed."""
+
+    def __init__(self, ticket: Ticket):
+        self.ticket = ticket
+
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor, **kwargs) -> torch.BoolTensor:
+        return torch.full((input_ids.shape[0],), self.ticket.expired(), dtype=torch.bool, device=input_ids.device)
+
+
+def is_vlm(model) -> bool:
+    return model_family(model) in VLM_FAMILIES
+
+
+def generation_preset(model, task: str, **overrides) -> dict:
+    """Resolve ``generate`` kwargs for a model/task from settings; explicit non-None overrides win."""
+    preset = dict(settings.GENERATION_PRESETS.get(model_family(model), {}).get(task, {}))
+    preset.update({k: v for k, v in overrides.items() if v is not None})
+    return preset
+
+
+def generate(model, inputs, processor=None, image_keys: list[str] | None = None, **generate_kwargs):
+    """Run ``model.generate`` on processor outputs; the single place where inference-time caching is layered in.
+
+    Parameters
+    ----------
+    model : any supported captioning model
+    inputs : processor output (BatchFeature / dict of tensors) already on the model device
+    processor : processor that produced ``inputs`` (its image config is part of the vision cache key)
+    image_keys : sha256 of each image, in the order the images appear in ``inputs``; enables the vision cache
+    generate_kwargs : forwarded to ``model.generate``
+    """
+    if isinstance(model, RemoteModel):
+        # The model server runs this same function next to the real model
+        return model.generate(inputs, image_keys, **generate_kwargs)
+    if generate_kwargs.get("stop_strings") and processor is not None:
+        # Stop-string matching needs the tokenizer to map strings onto token sequences
+        generate_kwargs.setdefault("tokenizer", getattr(processor, "tokenizer", processor))
+    if not settings.STATIC_CACHE_COMPILE:
+        # Keep static-cache decoding eager; compiled graphs are only worth it with warmed-up buckets
+        generate_kwargs.setdefault("disable_compile", True)
+    ticket = current_ticket.get()
+    if ticket is not None:
+        ticket.check()
+        criteria = StoppingCriteriaList(generate_kwargs.pop("stopping_criteria", None) or [])
+        criteria.append(TicketStoppingCriteria(ticket))
+        generate_kwargs["stopping_criteria"] = criteria
+    family = model_family(model)
+    with execution_context(model), vision_cache_scope(model, processor, image_keys):
+        if processor is not None and can_assist(family, inputs, generate_kwargs):
+            # Draft-and-verify decoding; dynamic cache (the draft and verification lengths vary per step)
+            output = assisted_generate(family, model, inputs, processor, generate_kwargs)
+        elif generate_kwargs.get("cache_implementation") == "static" and settings.STATIC_CACHE_BUCKETS:
+            output = _generate_bucketed(model, inputs, processor, generate_kwargs)
+        else:
+            output = model.generate(**inputs, **generate_kwargs)
+    if ticket is not None:
+        # A stopped decode is a truncated answer: never hand it back (or let it be cached)
+        ticket.check()
+    return output
+
+
+def _generate_bucketed(model, inputs, processor, generate_kwargs: dict):
+    """Pad the prompt to a bucket length and decode into a pooled static cache of matching shape."""
+    tokenizer = getattr(processor, "tokenizer", processor)
+    max_new_tokens = generate_kwargs.get("max_new_tokens") or model.generation_config.max_new_tokens
+    pad_token_id = getattr(tokenizer, "pad_token_id", None)
+    if not max_new_tokens or pad_token_id is None:
+        return model.generate(**inputs, **generate_kwargs)
+
+    bucket = static_cache.bucket_for(inputs["input_ids"].shape[-1], settings.STATIC_CACHE_BUCKETS)
+    padded, pad = static_cache.pad_to_bucket(inputs, bucket, pad_token_id)
+    kwargs = {k: v for k, v in generate_kwargs.items() if k != "cache_implementation"}
+    with static_cache.pool.lease(model, bucket + max_new_tokens, padded["input_ids"].shape[0]) as cache:
+        output = model.generate(**padded, past_key_values=cache, **kwargs)
+    # Strip the left padding so callers can keep slicing by their own prompt length
+    if hasattr(output, "sequences"):
+        output.sequences = output.sequences[:, pad:]
+        return output
+    return output[:, pad:]
+
+
+def generate_scored(model, inputs, processor=None, image_keys: list[str] | None = None,
+                    **generate_kwargs) -> tuple[torch.Tensor, list[float | None]]:
+    """Like ``generate`` but also returns a confidence per generated sequence.
+
+    Confidence is the geometric-mean probability of the generated tokens (exp of the mean token log-prob), or None
+    when the model does not expose per-step scores.
+    """
+    if isinstance(model, RemoteModel):
+        return model.generate_scored(inputs, image_keys, **generate_kwargs)
+    output = generate(model, inputs, processor, image_keys,
+                      return_dict_in_generate=True, output_scores=True, **generate_kwargs)
+    return output.sequences, _sequence_confidences(model, output)
+
+
+def _sequence_confidences(model, output) -> list[float | None]:
+    rows = output.sequences.shape[0]
+    if not getattr(output, "scores", None):
+        return [None] * rows
+    # BLIP delegates decoding to its text decoder, which owns the generation helpers
+    scorer = model if hasattr(model, "compute_transition_scores") else getattr(model, "text_decoder", None)
+    beam_indices = getattr(output, "beam_indices", None)
+    try:
+        # Beam scores are already log-probabilities; greedy/sampling scores are raw processed logits
+        transition = scorer.compute_transition_scores(output.sequences, output.scores, beam_indices,
+                                                      normalize_logits=beam_indices is None)
+    except Exception:
+        return [None] * rows
+    valid = torch.isfinite(transition)
+    # In a batch, rows that finished early are filled with padding until the longest one is done
+    pad_token_id = getattr(scorer.generation_config, "pad_token_id", None)
+    if pad_token_id is not None:
+        valid &= output.sequences[:, -transition.shape[-1]:] != pad_token_id
+    confidences = []
+    for logprobs, mask in zip(transition, valid):
+        logprobs = logprobs[mask]
+        confidences.append(float(logprobs.float().mean().exp()) if logprobs.numel() else None)
+    return confidences
+
+
+def forward_logits(model, inputs, processor=None, image_keys: list[str] | None = None) -> torch.Tensor:
+    """Single forward pass over ``inputs``; returns next-token logits of shape (batch, vocab)."""
+    if isinstance(model, RemoteModel):
+        return model.forward_logits(inputs, image_keys)
+    ticket = current_ticket.get()
+    if ticket is not None:
+        ticket.check()
+    with execution_context(model), vision_cache_scope(model, processor, image_keys):
+        outputs = model(**inputs, logits_to_keep=1)
+    return outputs.logits[:, -1, :]
+
+
+def append_tokens(inputs, token_ids: torch.Tensor):
+    """Append ``token_ids`` (1, n) to every per-token tensor of a processor output (ids, mask, token types)."""
+    extended = dict(inputs)
+    token_ids = token_ids.to(inputs["input_ids"].device)
+    extended["input_ids"] = torch.cat([inputs["input_ids"], token_ids], dim=-1)
+    if "attention_mask" in inputs:
+        extended["attention_mask"] = torch.cat(
+            [inputs["attention_mask"], torch.ones_like(token_ids, dtype=inputs["attention_mask"].dtype)], dim=-1
+        )
+    if "token_type_ids" in inputs:
+        extended["token_type_ids"] = torch.cat(
+            [inputs["token_type_ids"], torch.zeros_like(token_ids, dtype=inputs["token_type_ids"].dtype)], dim=-1
+        )
+    return extended
@@ -0,0 +1,103 @@
+import weakref
+
+import torch
+from PIL import Image
+from torchvision.transforms import InterpolationMode
+from torchvision.transforms.v2 import functional as F
+
+# PIL resample codes understood by tensor resizing (LANCZOS / BOX / HAMMING have no tensor equivalent)
+_INTERPOLATION = {
+    0: InterpolationMode.NEAREST,
+    2: InterpolationMode.BILINEAR,
+    3: InterpolationMode.BICUBIC,
+}
+
+# Fused rescale + normalize constants per image processor, keyed by (device, dtype)
+_constants: 'weakref.WeakKeyDictionary' = weakref.WeakKeyDictionary()
+
+
+def _image_processor(processor):
+    return getattr(processor, "image_processor", processor)
+
+
+def _interpolation(image_processor) -> InterpolationMode | None:
+    resample = getattr(image_processor, "resample", None)
+    if isinstance(resample, InterpolationMode):
+        return resample
+    return _INTERPOLATION.get(int(resample)) if resample is not None else None
+
+
+def _target_size(image_processor) -> tuple[int, int] | None:
+    # Slow processors keep a dict, fast ones a SizeDict; both index by name
+    try:
+        size = (image_processor.size["height"], image_processor.size["width"])
+    except (AttributeError, KeyError, TypeError):
+        return None
+    return size if None not in size else None
+
+
+def supports_batched_preprocessing(processor) -> bool:
+    """True for plain resize / rescale / normalize image processors (BLIP family), which this module reproduces."""
+    image_processor = _image_processor(processor)
+    return (
+        _target_size(image_processor) is not None
+        and _interpolation(image_processor) is not None
+        and not getattr(image_processor, "do_center_crop", False)
+        and not getattr(image_processor, "do_pad", False)
+    )
+
+
+def _normalization(image_processor, device: torch.device, dtype: torch.dtype) -> tuple[torch.Tensor, torch.Tensor]:
+    """(scale, bias) such that ``pixels * scale + bias`` == normalize(rescale(pixels)), shaped for (N, C, H, W)."""
+    per_processor = _constants.setdefault(image_processor, {})
+    key = (str(device), dtype)
+    if key not in per_processor:
+        rescale = image_processor.rescale_factor if image_processor.do_rescale else 1.0
+        if image_processor.do_normalize:
+            mean = torch.tensor(image_processor.image_mean, dtype=torch.float64)
+            std = torch.tensor(image_processor.image_std, dtype=torch.float64)
+        else:
+            mean, std = torch.zeros(3, dtype=torch.float64), torch.ones(3, dtype=torch.float64)
+        scale = (rescale / std).view(1, -1, 1, 1).to(device=device, dtype=dtype)
+        bias = (-mean / std).view(1, -1, 1, 1).to(device=device, dtype=dtype)
+        per_processor[key] = (scale, bias)
+    return per_processor[key]
+
+
+def preprocess_images(processor, images: list[Image.Image], device: str | torch.device = "cpu",
+                      dtype: torch.dtype = torch.float32) -> torch.Tensor:
+    """Batched equivalent of ``processor(images=images).pixel_values`` for resize / rescale / normalize processors.
+
+    Images are resized as uint8 tensors (grouped by input size, one call per group), stacked, moved to ``device`` as
+    uint8 (from pinned memory on CUDA) and rescaled + normalized there in a single fused multiply-add.
+
+    Parameters
+    ----------
+    processor : processor or image processor (see ``supports_batched_preprocessing``)
+    images : list[PIL.Image] (converted to RGB)
+    device : target device of the returned tensor
+    dtype : floating dtype of the returned tensor (the model's dtype)
+
+    Returns
+    -------
+    torch.Tensor : contiguous pixel values of shape (len(images), 3, height, width)
+    """
+    image_processor = _image_processor(processor)
+    device = torch.device(device)
+    size = _target_size(image_processor)
+    interpolation = _interpolation(image_processor)
+
+    batch = torch.empty((len(images), 3, *size), dtype=torch.uint8,
+                        pin_memory=device.type == "cuda" and torch.cuda.is_available())
+    groups: dict = {}
+    for i, image in enumerate(images):
+        groups.setdefault(image.size, []).append(i)
+    for indices in groups.values():
+        group = torch.stack([F.pil_to_tensor(images[i].convert("RGB")) for i in indices])
+        if image_processor.do_resize and tuple(group.shape[-2:]) != size:
+            group = F.resize(group, list(size), interpolation=interpolation, antialias=True)
+        batch[indices] = group
+
+    scale, bias = _normalization(image_processor, device, dtype)
+    pixels = batch.to(device, non_blocking=True).to(dtype)
+    return torch.addcmul(bias, pixels, scale).contiguous()
@@ -1,26 +1,31 @@
+import threading
 from typing import List
 
-import nltk
-import spacy
+# spaCy pipeline, loaded (and downloaded if missing) on first use
+_nlp = None
+_nlp_lock = threading.Lock()
 
-try:
-    NLP = spacy.load("en_core_web_sm")
-except OSError:
-    from spacy.cli import download
 
-    download("en_core_web_sm")
+def _get_nlp():
+    global _nlp
+    with _nlp_lock:
+        if _nlp is None:
+            import spacy
+            try:
+                _nlp = spacy.load("en_core_web_sm")
+            except OSError:
+                from spacy.cli import download
+                download("en_core_web_sm")
+                _nlp = spacy.load("en_core_web_sm")
+        return _nlp
 
 
 def generate_spacy_tags(caption: str) -> List[str]:
     """Generate tags from caption using spaCy NLP."""
+    from nltk import bigrams
+
     # Use noun_chunks + nouns + adjectives, then dedupe and limit
-    NLP = None
-    try:
-        NLP = spacy.load("en_core_web_sm")
-    except OSError:
-        from spacy.cli import download
-        download("en_core_web_sm")
-    doc = NLP(caption)
+    doc = _get_nlp()(caption)
     candidates_tags = []
     # nouns and proper nouns and adjectives
     for token in doc:
@@ -30,7 +35,7 @@ def generate_spacy_tags(caption: str) -> List[str]:
                 candidates_tags.append(txt)
     # NLTK bigrams
     tokens = [token.text.lower() for token in doc if token.is_alpha and not token.is_stop]
-    for bg in nltk.bigrams(tokens):
+    for bg in bigrams(tokens):
         bigram = "_".join(bg)
         if len(bigram.replace("_", "")) > 2:
             candidates_tags.append(bigram)
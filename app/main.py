@@ -1,4 +1,5 @@
 import logging
+from contextlib import asynccontextmanager
 
 from fastapi import FastAPI
 from fastapi import Request
@@ -8,6 +9,7 @@ from fastapi.templating import Jinja2Templates
 from prometheus_fastapi_instrumentator import Instrumentator
 
 from app.prompts import DEFAULT_PROMPTS
+from app.responses import FastJSONResponse
 from app.routers import caption, admin
 from app.settings import settings
 
@@ -20,8 +22,22 @@ logging.basicConfig(
 # Quieter access logs in production
 logging.getLogger("uvicorn.access").setLevel(logging.WARNING)
 
+logger = logging.getLogger(__name__)
+
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    # Load (and optionally warm up) configured models before serving traffic; the model server warms its own
+    if settings.WARMUP_MODELS and not settings.MODEL_SERVER_ENABLED:
+        from app.services.warmup import warm_up
+        for key in settings.WARMUP_MODELS:
+            logger.info("Warming up model: %s", key)
+            warm_up(key)
+    yield
+
+
 # Create FastAPI app after logging setup so any startup errors are logged with our format
-app = FastAPI(title="VLM Caption API", version="1.0.0")
+app = FastAPI(title="VLM Caption API", version="1.0.0", lifespan=lifespan, default_response_class=FastJSONResponse)
 
 # CORS middleware
 app.add_middleware(
@@ -0,0 +1,17 @@
+import torch
+from transformers import AutoModelForCausalLM, AutoTokenizer, PreTrainedModel, PreTrainedTokenizerBase
+
+DEVICE = "cuda" if torch.cuda.is_available() else "mps" if torch.backends.mps.is_available() else "cpu"
+
+
+def initialize_assistant_model(model_id: str = "google/gemma-3-1b-it",
+                               device: str | torch.device = DEVICE) -> tuple[PreTrainedTokenizerBase, PreTrainedModel]:
+    """Initialize a small text-only draft model (and its tokenizer) for assisted decoding."""
+    tokenizer = AutoTokenizer.from_pretrained(model_id)
+    model = AutoModelForCausalLM.from_pretrained(
+        model_id,
+        dtype=torch.bfloat16,
+        attn_implementation="sdpa"
+    ).to(device)
+    model.eval()
+    return tokenizer, model
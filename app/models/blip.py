@@ -5,23 +5,37 @@ from transformers import BlipProcessor, BlipForConditionalGeneration, Blip2Proce
 
 from app.inference.captioning import infer_image_caption
 from app.prompts import DEFAULT_PROMPTS
+from app.settings import settings
 
 DEVICE = "cuda" if torch.cuda.is_available() else "mps" if torch.backends.mps.is_available() else "cpu"
 DEFAULT_BLIP_PROMPT = DEFAULT_PROMPTS.get("blip").get("caption_prompt")
 DEFAULT_BLIP2_PROMPT = DEFAULT_PROMPTS.get("blip2").get("caption_prompt")
-print(f"Using device: {DEVICE}")
+
+
+def initialize_blip_processor() -> BlipProcessor:
+    """Initialize the BLIP processor only (e.g. for HTTP workers backed by the model server)."""
+    return BlipProcessor.from_pretrained(
+        "Salesforce/blip-image-captioning-base", use_fast=settings.FAST_IMAGE_PROCESSORS
+    )
+
+
+def initialize_blip2_processor() -> Blip2Processor:
+    """Initialize the BLIP 2 processor only."""
+    return Blip2Processor.from_pretrained(
+        "Salesforce/blip2-opt-2.7b", use_fast=settings.FAST_IMAGE_PROCESSORS
+    )
 
 
 def initialize_blip_model() -> tuple[BlipProcessor, BlipForConditionalGeneration, str]:
     """Initialize the BLIP model and processor."""
-    processor = BlipProcessor.from_pretrained("Salesforce/blip-image-captioning-base", use_fast=False)
+    processor = initialize_blip_processor()
     model = BlipForConditionalGeneration.from_pretrained("Salesforce/blip-image-captioning-base").to(DEVICE)
     return processor, model, DEVICE
 
 
 def initialize_blip2_model() -> tuple[Blip2Processor, Blip2ForConditionalGeneration, str]:
     """Initialize the BLIP model and processor."""
-    processor = Blip2Processor.from_pretrained("Salesforce/blip2-opt-2.7b", use_fast=False)
+    processor = initialize_blip2_processor()
     model = Blip2ForConditionalGeneration.from_pretrained("Salesforce/blip2-opt-2.7b").to(DEVICE)
     return processor, model, DEVICE
 
@@ -4,12 +4,22 @@ import torch
 from transformers import AutoProcessor, Gemma3Processor, Gemma3ForConditionalGeneration
 
 from app.prompts import DEFAULT_PROMPTS
+from app.settings import settings
 
 DEVICE = "cuda" if torch.cuda.is_available() else "mps" if torch.backends.mps.is_available() else "cpu"
 DEFAULT_GEMMA_PROMPT = DEFAULT_PROMPTS.get("gemma").get("caption_prompt")
 DEFAULT_FLAG_GEMMA_PROMPT = DEFAULT_PROMPTS.get("gemma").get("flag_caption_prompt")
 
 
+def initialize_gemma_processor() -> Gemma3Processor:
+    """Initialize the Gemma processor only (e.g. for HTTP workers backed by the model server)."""
+    return AutoProcessor.from_pretrained(
+        "google/gemma-3-4b-it",
+        padding_side="left",
+        use_fast=settings.FAST_IMAGE_PROCESSORS
+    )
+
+
 def initialize_gemma_model() -> tuple[Gemma3Processor, Gemma3ForConditionalGeneration, str]:
     """Initialize the Gemma model and processor."""
     model = Gemma3ForConditionalGeneration.from_pretrained(
@@ -17,10 +27,7 @@ def initialize_gemma_model() -> tuple[Gemma3Processor, Gemma3ForConditionalGener
         dtype=torch.bfloat16,
         attn_implementation="sdpa"
     ).to(DEVICE)
-    processor = AutoProcessor.from_pretrained(
-        "google/gemma-3-4b-it",
-        padding_side="left"
-    )
+    processor = initialize_gemma_processor()
     return processor, model, DEVICE
 
 
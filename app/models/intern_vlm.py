@@ -1,12 +1,21 @@
 import torch
 from transformers import AutoProcessor, InternVLProcessor, InternVLForConditionalGeneration
 
+from app.settings import settings
+
 DEVICE = "cuda" if torch.cuda.is_available() else "mps" if torch.backends.mps.is_available() else "cpu"
 
 
+def initialize_intern_vlm_processor() -> InternVLProcessor:
+    """Initialize the InternVLM processor only (e.g. for HTTP workers backed by the model server)."""
+    return AutoProcessor.from_pretrained(
+        "OpenGVLab/InternVL3-1B-hf", use_fast=settings.FAST_IMAGE_PROCESSORS
+    )
+
+
 def initialize_intern_vlm_model() -> tuple[InternVLProcessor, InternVLForConditionalGeneration, str]:
     """Initialize the InternVLM model and processor."""
-    processor = AutoProcessor.from_pretrained("OpenGVLab/InternVL3-1B-hf")
+    processor = initialize_intern_vlm_processor()
     model = InternVLForConditionalGeneration.from_pretrained("OpenGVLab/InternVL3-1B-hf").to(DEVICE)
     return processor, model, DEVICE
 
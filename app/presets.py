@@ -0,0 +1,38 @@
+import copy
+
+# Chat-template vision-language models (collective captioning, flagging)
+VLM_FAMILIES = {"gemma", "intern_vlm"}
+
+# Per-model, per-task keyword arguments for `model.generate`.
+# Tasks: "caption" (single image), "collective" (image set), "flag" (JSON flag check).
+# The flag task also accepts "mode": "logits" scores the `true` / `false` tokens in a single forward pass,
+# "generate" decodes the JSON and stops at the closing brace (via `stop_strings`).
+_VLM_PRESETS: dict = {
+    "caption": {"max_new_tokens": 50, "num_beams": 1, "do_sample": False, "cache_implementation": "static"},
+    "collective": {"max_new_tokens": 200, "num_beams": 1, "do_sample": False, "cache_implementation": "static"},
+    "flag": {
+        "mode": "logits",
+        "max_new_tokens": 16,
+        "stop_strings": ["}"],
+        "num_beams": 1,
+        "do_sample": False,
+        "cache_implementation": "static",
+    },
+}
+
+DEFAULT_GENERATION_PRESETS: dict = {
+    # BLIP models: keep the checkpoint's own generation config unless overridden
+    "blip": {"caption": {}},
+    "blip2": {"caption": {}},
+    "gemma": copy.deepcopy(_VLM_PRESETS),
+    "intern_vlm": copy.deepcopy(_VLM_PRESETS),
+}
+
+
+def merge_presets(overrides: dict | None) -> dict:
+    """Overlay ``{model: {task: {kwarg: value}}}`` overrides onto the defaults (kwarg-level merge)."""
+    presets = copy.deepcopy(DEFAULT_GENERATION_PRESETS)
+    for model_key, tasks in (overrides or {}).items():
+        for task, kwargs in tasks.items():
+            presets.setdefault(model_key, {}).setdefault(task, {}).update(kwargs)
+    return presets
@@ -0,0 +1,30 @@
+from fastapi.responses import JSONResponse, Response
+
+from app.services.serialization import dumps_json, orjson
+
+if orjson is not None:
+    from fastapi.responses import ORJSONResponse as FastJSONResponse
+else:
+    FastJSONResponse = JSONResponse
+
+
+class RawJSONResponse(Response):
+    """Response whose body is already-encoded JSON bytes (no validation, no re-serialization)."""
+    media_type = "application/json"
+
+
+def cached_item_json(filename: str, raw: bytes) -> bytes | None:
+    """Splice a cached caption item (JSON object bytes) into a result item with ``filename`` and ``"cache": true``.
+
+    Returns None when ``raw`` is not a non-empty JSON object, so callers can fall back to the regular path.
+    """
+    raw = raw.strip()
+    if not raw.startswith(b"{") or raw[1:].lstrip().startswith(b"}"):
+        return None
+    # Keys written first lose to duplicates later in the object; the cached item never holds these two
+    return b'{"filename":' + dumps_json(filename) + b',"cache":true,' + raw[1:]
+
+
+def results_json(items: list[bytes]) -> bytes:
+    """``CaptionResponse`` body from per-item JSON bytes."""
+    return b'{"results":[' + b",".join(items) + b"]}"
@@ -1,5 +1,11 @@
-from fastapi import APIRouter, Depends
+import time
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import Response
+
 from app.deps import get_redis, require_api_key
+from app.services.disk_cache import get_disk_cache
+from app.services.profiling import capture_profile, ProfilerBusy
 
 # All routes here require X-API-Key by default (via dependencies=...)
 router = APIRouter(prefix="/api/admin", tags=["admin"], dependencies=[Depends(require_api_key)])
@@ -8,4 +14,26 @@ router = APIRouter(prefix="/api/admin", tags=["admin"], dependencies=[Depends(re
 def reset_redis_cache(rdb = Depends(get_redis)):
     # Flush DB: destructive — keep protected
     rdb.flushdb()
-    return {"message": "Redis cache cleared"}
\ No newline at end of file
+    disk = get_disk_cache()
+    if disk is not None:
+        disk.clear()
+    return {"message": "Redis cache cleared"}
+
+
+# Sync endpoint: the capture sleeps in a threadpool thread while this worker keeps serving traffic
+@router.post("/profile")
+def profile_worker(
+        seconds: float = Query(10.0, description="Capture duration, clamped to 1..60 seconds"),
+        interval_ms: float = Query(10.0, description="Python stack sampling interval, clamped to 1..1000 ms"),
+        torch_ops: bool = Query(True, description="Include a torch.profiler CPU operator table"),
+        memory: bool = Query(False, description="Include a tracemalloc allocation snapshot (slows the worker)"),
+):
+    seconds = min(max(seconds, 1.0), 60.0)
+    interval = min(max(interval_ms, 1.0), 1000.0) / 1000
+    try:
+        archive = capture_profile(seconds, sample_interval=interval, torch_ops=torch_ops, memory=memory)
+    except ProfilerBusy as exc:
+        raise HTTPException(status_code=409, detail=str(exc))
+    filename = f"profile-{time.strftime('%Y%m%d-%H%M%S')}.zip"
+    return Response(archive, media_type="application/zip",
+                    headers={"Content-Disposition": f'attachment; filename="{filename}"'})
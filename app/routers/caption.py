@@ -1,19 +1,21 @@
+import asyncio
 import logging
 from io import BytesIO
 from typing import List
 
 from PIL import Image
-from transformers import InternVLForConditionalGeneration, Gemma3ForConditionalGeneration
+from fastapi.concurrency import run_in_threadpool
 
 from app.deps import get_redis
+from app.responses import RawJSONResponse, cached_item_json, results_json
 from app.schemas import CaptionQuery, CaptionResponse, CollectiveResponse
+from app.services.admission import controller as admission, AdmissionRejected, RequestCancelled, Ticket
 from app.services.cache import Cache
-from app.services.model_registry import registry
-from fastapi import APIRouter, UploadFile, File, Depends, HTTPException
+from app.services.serialization import dumps_json
+from app.settings import settings
+from fastapi import APIRouter, UploadFile, File, Depends, HTTPException, Header, Request
 
-from app.inference.captioning import infer_image_caption, infer_collective_caption
-from app.inference.flagging import is_flagged
-from app.inference.tagging import generate_spacy_tags
+from app.presets import VLM_FAMILIES
 
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/api", tags=["caption"])
@@ -21,105 +23,301 @@ router = APIRouter(prefix="/api", tags=["caption"])
 # Limit to common image MIME types; reject others early with 415
 ALLOWED_CONTENT_TYPES = {"image/jpeg", "image/png", "image/webp"}
 
+# Model code (torch, transformers, spaCy) is imported on first use inside the worker-thread functions below, so a
+# fresh worker serves cache hits without loading it.
+
+# How often a running request checks whether its client is still connected (seconds)
+DISCONNECT_POLL_INTERVAL = 0.5
+
 
 @router.post("/caption-images", response_model=CaptionResponse)
 async def caption_images(
+        request: Request,
         images: List[UploadFile] = File(...),
         query: CaptionQuery = Depends(),
         rdb=Depends(get_redis),
+        x_deadline_ms: int | None = Header(default=None),
 ):
-    # Resolve the requested model (thread-safe, memory-bounded)
-    processor, model, device = registry.get(query.model)
+    uploads = await _read_uploads(images)
     cache = Cache(rdb)
 
-    results = []
-    for f in images:
-        if f.content_type not in ALLOWED_CONTENT_TYPES:
-            raise HTTPException(status_code=415, detail=f"Unsupported content type: {f.content_type}")
+    # Cache key is v1:img:{sha256(bytes)}
+    file_hashes = [cache.hash_bytes(file_bytes) for _, file_bytes in uploads]
+
+    # Fast path: cached items are spliced into the response as stored JSON bytes (no per-item validation)
+    results = [None] * len(uploads)
+    misses = []
+    # Redis and the disk tier are blocking clients; keep their waits off the event loop
+    cached_items = await run_in_threadpool(cache.get_many_raw_json, [cache.img_key(h) for h in file_hashes])
+    for i, ((filename, file_bytes), file_hash, raw) in enumerate(zip(uploads, file_hashes, cached_items)):
+        results[i] = cached_item_json(filename, raw) if raw else None
+        if results[i] is None:
+            misses.append((i, file_hash, file_bytes))
+
+    if misses:
+        # Only uncached images cost model time; a cascade is admitted on the first model, and its escalations take
+        # a slot (and budget) of the escalation model once they are known
+        admit_key = settings.CASCADE_FIRST_MODEL if query.model == "auto" else query.model
+        tasks = ["caption", "flag"] if admit_key in VLM_FAMILIES else ["caption"]
+        ticket = _admit(admit_key, len(misses), len(misses) * _estimated_tokens(admit_key, tasks), x_deadline_ms)
+        items = await _run_admitted(request, ticket, _caption_misses, cache, query, misses)
+        for (i, _, _), item in zip(misses, items):
+            results[i] = dumps_json({"filename": uploads[i][0], **item, "cache": False})
+
+    return RawJSONResponse(results_json(results))
 
-        # Read the upload once; use bytes for hashing and decoding
-        file_bytes = await f.read()
-        if not file_bytes:
-            raise HTTPException(status_code=400, detail="Empty file")
 
-        # Cache key is v1:img:{sha256(bytes)}
-        file_hash = cache.hash_bytes(file_bytes)
-        key = cache.img_key(file_hash)
+def _caption_misses(cache: Cache, query: CaptionQuery, misses: list) -> list[dict]:
+    from app.inference.captioning import infer_image_captions
+    from app.services.model_registry import registry
+
+    # Decode images from bytes (convert to RGB for consistency)
+    images = [Image.open(BytesIO(file_bytes)).convert("RGB") for _, _, file_bytes in misses]
+    file_hashes = [file_hash for _, file_hash, _ in misses]
+    if query.model == "auto":
+        items = _cascade_captions(cache, query, file_hashes, images)
+    else:
+        captions = [None] * len(misses)
+        if query.model in {"blip", "blip2"}:
+            # BLIP captions need no per-image chat prompt: preprocess and decode all misses as one batch
+            with registry.lease(query.model) as (processor, model, device):
+                captions = infer_image_captions(processor, model, device, images, query.caption_prompt,
+                                                image_keys=file_hashes)
+        items = [_caption_image(query.model, cache, query, file_hash, image, caption=caption)
+                 for file_hash, image, caption in zip(file_hashes, images, captions)]
+
+    for file_hash, item in zip(file_hashes, items):
+        # Best-effort cache write (non-fatal on Redis outage)
+        cache.set_json(cache.img_key(file_hash), item)
+    return items
 
-        # Fast path: return cached caption/tags
-        cached = cache.get_json(key)
-        if cached:
-            results.append({"filename": f.filename, **cached, "cache": True})
-            continue
 
-        # Decode image from bytes (convert to RGB for consistency)
-        image = Image.open(BytesIO(file_bytes)).convert("RGB")
+def _caption_image(model_key: str, cache: Cache, query: CaptionQuery, file_hash: str, image: Image.Image,
+                   caption: str | None = None) -> dict:
+    """Caption (unless ``caption`` is already known) and flag one image with ``model_key``; returns the cache item."""
+    from app.inference.captioning import infer_image_caption
+    from app.inference.flagging import is_flagged
+    from app.inference.tagging import generate_spacy_tags
+    from app.services.model_registry import registry
 
+    # Resolve the requested model (thread-safe, memory-bounded); the lease keeps it loaded while in use
+    with registry.lease(model_key) as (processor, model, device):
         # Run captioning (prompt optional); keep inference code minimal in route
-        caption = infer_image_caption(processor, model, device, image, query.caption_prompt)
-        if isinstance(model, InternVLForConditionalGeneration) or isinstance(model, Gemma3ForConditionalGeneration):
-            flagged = is_flagged(processor, model, device, [image], query.flag_caption_prompt)
+        if caption is None:
+            caption = infer_image_caption(processor, model, device, image, query.caption_prompt,
+                                          image_key=file_hash)
+        if model_key in VLM_FAMILIES:
+            # Reuse a per-image verdict recorded by an earlier (possibly collective) request
+            flag_key = cache.artifact_key("flag", file_hash, model_key, query.flag_caption_prompt)
+            known_flag = cache.get_json(flag_key)
+            if known_flag:
+                flagged = known_flag["flagged"]
+            else:
+                flagged = is_flagged(processor, model, device, [image], query.flag_caption_prompt,
+                                     image_keys=[file_hash])
+                cache.set_json(flag_key, {"flagged": bool(flagged)})
+            if caption:
+                cache.set_json(cache.artifact_key("caption", file_hash, model_key, query.caption_prompt),
+                               {"caption": caption})
         else:
             flagged = None
-        # Fallback message if model returns nothing
-        if not caption:
-            caption = "No caption could be generated."
-            item = {"caption": caption, "tags": [], "flagged": bool(flagged)}
-        else:
-            item = {"caption": caption, "tags": generate_spacy_tags(caption), "flagged": bool(flagged)}
+    # Fallback message if model returns nothing
+    if not caption:
+        caption = "No caption could be generated."
+        return {"caption": caption, "tags": [], "flagged": bool(flagged), "model": model_key}
+    return {"caption": caption, "tags": generate_spacy_tags(caption), "flagged": bool(flagged), "model": model_key}
 
-        # Best-effort cache write (non-fatal on Redis outage)
-        cache.set_json(key, item)
-        results.append({"filename": f.filename, **item, "cache": False})
 
-    return {"results": results}
+def _cascade_captions(cache: Cache, query: CaptionQuery, file_hashes: list[str],
+                      images: list[Image.Image]) -> list[dict]:
+    """model=auto: caption with the cheap model and escalate only the images whose confidence is below the threshold.
+
+    Each model is leased once per request: all images are scored together on the first model, then the unsure ones
+    are re-captioned together on the escalation model, so the two are swapped at most once even at MODEL_CAPACITY=1.
+    """
+    from app.inference.captioning import infer_image_caption, infer_image_captions, caption_quality
+    from app.services.model_registry import registry
+
+    first_key, escalation_key = settings.CASCADE_FIRST_MODEL, settings.CASCADE_ESCALATION_MODEL
+    items: list[dict | None] = [None] * len(images)
+    escalate = []
+    with registry.lease(first_key) as (processor, model, device):
+        if first_key in {"blip", "blip2"}:
+            captions, confidences = infer_image_captions(processor, model, device, images, query.caption_prompt,
+                                                         image_keys=file_hashes, return_confidence=True)
+        else:
+            captions, confidences = zip(*[
+                infer_image_caption(processor, model, device, image, query.caption_prompt, image_key=file_hash,
+                                    return_confidence=True)
+                for file_hash, image in zip(file_hashes, images)
+            ])
+        for i, (caption, confidence) in enumerate(zip(captions, confidences)):
+            # Token probabilities can be confidently wrong on degenerate (repetitive / truncated) captions
+            quality = caption_quality(caption)
+            score = quality if confidence is None else min(confidence, quality)
+            if score >= settings.CASCADE_MIN_CONFIDENCE:
+                items[i] = _caption_image(first_key, cache, query, file_hashes[i], images[i], caption=caption)
+            else:
+                logger.info("Escalating caption from %s to %s (confidence=%.2f)", first_key, escalation_key, score)
+                escalate.append(i)
+
+    if escalate:
+        tasks = ["caption", "flag"] if escalation_key in VLM_FAMILIES else ["caption"]
+        # The request was admitted on the first model; escalations take a slot and budget of the escalation model
+        with admission.slot(escalation_key, len(escalate), len(escalate) * _estimated_tokens(escalation_key, tasks)):
+            with registry.lease(escalation_key):
+                for i in escalate:
+                    items[i] = _caption_image(escalation_key, cache, query, file_hashes[i], images[i])
+    return items
 
 
 @router.post("/caption-collective-images", response_model=CollectiveResponse)
 async def caption_collective_images(
+        request: Request,
         images: List[UploadFile] = File(...),
         query: CaptionQuery = Depends(),
         rdb=Depends(get_redis),
+        x_deadline_ms: int | None = Header(default=None),
 ):
-    # Collective captioning is only supported on certain models
-    if query.model not in {"gemma", "intern_vlm"}:
+    # Collective captioning is only supported on certain models (auto goes straight to the escalation model)
+    model_key = _resolve_model_key(query.model)
+    if model_key not in VLM_FAMILIES:
         raise HTTPException(status_code=400, detail="Collective captioning only supported for Gemma / InternVLM models")
 
-    processor, model, device = registry.get(query.model)
     cache = Cache(rdb)
 
-    # Prepare images and their hashes
-    file_hashes = []
-    pil_images = []
-    for f in images:
-        if f.content_type not in ALLOWED_CONTENT_TYPES:
-            raise HTTPException(status_code=415, detail=f"Unsupported content type: {f.content_type}")
-        file_bytes = await f.read()
-        if not file_bytes:
-            raise HTTPException(status_code=400, detail="Empty file")
-        file_hashes.append(cache.hash_bytes(file_bytes))
-        pil_images.append(Image.open(BytesIO(file_bytes)).convert("RGB"))
+    # Prepare image bytes and their hashes; decoding waits until the collection cache has missed
+    file_blobs = [file_bytes for _, file_bytes in await _read_uploads(images)]
+    file_hashes = [cache.hash_bytes(b) for b in file_blobs]
 
     # Combined hash for the collection; order matters (keep client order)
     combined_hash = cache.hash_bytes("".join(file_hashes).encode("utf-8"))
     key = cache.collection_key(combined_hash)
 
-    cached = cache.get_json(key)
+    cached = await run_in_threadpool(cache.get_raw_json, key)
     if cached:
-        return cached
+        return RawJSONResponse(cached)
+
+    ticket = _admit(model_key, len(file_blobs), _estimated_tokens(model_key, ["collective", "flag"]),
+                    x_deadline_ms)
+    return await _run_admitted(request, ticket, _caption_collection, model_key, cache, query,
+                               key, file_hashes, file_blobs)
 
-    # Generate a single caption for the whole set
-    collective_caption = infer_collective_caption(
-        processor, model, device, pil_images, query.caption_prompt, max_new_tokens=200
-    )
-    flagged = is_flagged(processor, model, device, pil_images, query.flag_caption_prompt, max_new_tokens=200)
+
+def _caption_collection(model_key: str, cache: Cache, query: CaptionQuery, key: str,
+                        file_hashes: list[str], file_blobs: list[bytes]) -> dict:
+    from app.inference.captioning import infer_collective_caption
+    from app.inference.tagging import generate_spacy_tags
+    from app.services.model_registry import registry
+
+    pil_images = [Image.open(BytesIO(b)).convert("RGB") for b in file_blobs]
+    known_captions = None
+    if settings.COLLECTIVE_REUSE_CAPTIONS:
+        caption_artifacts = cache.get_many_json(
+            [cache.artifact_key("caption", h, model_key) for h in file_hashes]
+        )
+        known_captions = [a.get("caption") if a else None for a in caption_artifacts]
+
+    with registry.lease(model_key) as (processor, model, device):
+        # Per-image flag verdicts recorded by earlier requests (collective or single-image)
+        flagged = _collective_flag(cache, processor, model, device, model_key, query, file_hashes, pil_images)
+
+        # Generate a single caption for the whole set
+        collective_caption = infer_collective_caption(
+            processor, model, device, pil_images, query.caption_prompt,
+            known_captions=known_captions, image_keys=file_hashes,
+        )
 
     response = {
         "collective_caption": collective_caption or "No caption could be generated.",
         "count": len(pil_images),
         "tags": generate_spacy_tags(collective_caption) if collective_caption else [],
         "flagged": bool(flagged),
+        "model": model_key,
     }
 
     cache.set_json(key, response)
     return response
+
+
+def _collective_flag(cache: Cache, processor, model, device: str, model_key: str, query: CaptionQuery,
+                     file_hashes: list[str], pil_images: list[Image.Image]) -> bool:
+    """Resolve the "any image is flagged" verdict, running the model only on images without a cached verdict."""
+    from app.inference.flagging import is_flagged
+
+    flag_keys = [cache.artifact_key("flag", h, model_key, query.flag_caption_prompt) for h in file_hashes]
+    known = [a.get("flagged") if a else None for a in cache.get_many_json(flag_keys)]
+
+    # A single known positive settles the whole collection
+    if any(verdict is True for verdict in known):
+        return True
+    unseen = [i for i, verdict in enumerate(known) if verdict is None]
+    if not unseen:
+        return False
+
+    flagged = is_flagged(processor, model, device, [pil_images[i] for i in unseen],
+                         query.flag_caption_prompt,
+                         image_keys=[file_hashes[i] for i in unseen])
+    # A negative verdict covers every image in the pass; a positive one only pins down a lone image
+    if not flagged or len(unseen) == 1:
+        for i in unseen:
+            cache.set_json(flag_keys[i], {"flagged": bool(flagged)})
+    return flagged
+
+
+async def _read_uploads(images: List[UploadFile]) -> list[tuple[str, bytes]]:
+    """Validate and read every upload once; bytes are used for hashing and decoding."""
+    uploads = []
+    for f in images:
+        if f.content_type not in ALLOWED_CONTENT_TYPES:
+            raise HTTPException(status_code=415, detail=f"Unsupported content type: {f.content_type}")
+        file_bytes = await f.read()
+        if not file_bytes:
+            raise HTTPException(status_code=400, detail="Empty file")
+        uploads.append((f.filename, file_bytes))
+    return uploads
+
+
+def _resolve_model_key(model: str) -> str:
+    # Collective requests with model=auto are served by the cascade's escalation model
+    return settings.CASCADE_ESCALATION_MODEL if model == "auto" else model
+
+
+def _estimated_tokens(model_key: str, tasks: list[str]) -> int:
+    """Upper bound on generated tokens per image/collection for the given tasks, from the generation presets."""
+    presets = settings.GENERATION_PRESETS.get(model_key, {})
+    total = 0
+    for task in tasks:
+        preset = presets.get(task, {})
+        # Logit-scored flags take a single forward pass; BLIP's own config caps captions at ~20 tokens
+        total += 1 if preset.get("mode") == "logits" else preset.get("max_new_tokens", 20)
+    return total
+
+
+def _admit(model_key: str, images: int, max_new_tokens: int, deadline_ms: int | None) -> Ticket:
+    try:
+        return admission.admit(model_key, images, max_new_tokens, deadline_ms)
+    except AdmissionRejected as exc:
+        headers = {"Retry-After": str(max(1, int(exc.retry_after)))} if exc.retry_after else None
+        raise HTTPException(status_code=503, detail=exc.detail, headers=headers)
+
+
+async def _run_admitted(request: Request, ticket: Ticket, fn, *args):
+    """Run blocking inference off the event loop, cancelling generation if the client disconnects."""
+    watcher = asyncio.create_task(_cancel_on_disconnect(request, ticket))
+    try:
+        return await run_in_threadpool(admission.run, ticket, fn, *args)
+    except RequestCancelled as exc:
+        # 499: client closed request (nobody reads this one); 504: deadline passed
+        raise HTTPException(status_code=499 if ticket.cancelled.is_set() else 504, detail=str(exc))
+    finally:
+        watcher.cancel()
+
+
+async def _cancel_on_disconnect(request: Request, ticket: Ticket):
+    while not ticket.cancelled.is_set():
+        if await request.is_disconnected():
+            logger.info("Client disconnected; cancelling %s generation", ticket.model)
+            ticket.cancelled.set()
+            return
+        await asyncio.sleep(DISCONNECT_POLL_INTERVAL)
@@ -4,8 +4,8 @@ from pydantic import BaseModel, Field
 
 
 class CaptionQuery(BaseModel):
-    # Model selection per request
-    model: str = Field("blip", pattern=r"^(blip|blip2|gemma|intern_vlm)$")
+    # Model selection per request ("auto" = cheap-first cascade with escalation)
+    model: str = Field("blip", pattern=r"^(blip|blip2|gemma|intern_vlm|auto)$")
     # Optional per-request prompts (fallback to sensible defaults server-side)
     caption_prompt: Optional[str] = None
     flag_caption_prompt: Optional[str] = None
@@ -17,6 +17,8 @@ class CaptionItem(BaseModel):
     tags: List[str] = []
     flagged: bool | None = None
     cache: bool = False
+    # Model that produced the caption (useful with model=auto)
+    model: str | None = None
 
 
 class CaptionResponse(BaseModel):
@@ -28,3 +30,4 @@ class CollectiveResponse(BaseModel):
     count: int
     tags: List[str] = []
     flagged: bool | None = None
+    model: str | None = None
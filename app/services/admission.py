@@ -0,0 +1,169 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+
+from app.settings import settings
+
+logger = logging.getLogger(__name__)
+
+# Rough per-model cost model in seconds: prefill per image + decode per generated token.
+# Refined at runtime by an EWMA of observed / estimated time; override via ADMISSION_COSTS.
+DEFAULT_COST_MODEL: dict = {
+    "blip": {"per_image": 0.3, "per_token": 0.01},
+    "blip2": {"per_image": 1.0, "per_token": 0.05},
+    "gemma": {"per_image": 2.0, "per_token": 0.1},
+    "intern_vlm": {"per_image": 0.6, "per_token": 0.03},
+}
+
+
+class AdmissionRejected(Exception):
+    """Request refused before any model work (overloaded, or it cannot finish before its deadline)."""
+
+    def __init__(self, detail: str, retry_after: float | None = None):
+        super().__init__(detail)
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+class RequestCancelled(Exception):
+    """Generation was aborted because the client disconnected or the deadline passed."""
+
+
+@dataclass
+class Ticket:
+    model: str
+    cost: float
+    # time.monotonic() value after which results are useless to the client
+    deadline: float | None = None
+    cancelled: threading.Event = field(default_factory=threading.Event)
+    # Seconds spent inside nested slots of other models (not this model's work)
+    delegated: float = 0.0
+
+    def remaining(self) -> float | None:
+        return None if self.deadline is None else self.deadline - time.monotonic()
+
+    def expired(self) -> bool:
+        return self.cancelled.is_set() or (self.deadline is not None and time.monotonic() > self.deadline)
+
+    def check(self):
+        if self.expired():
+            raise RequestCancelled("Client disconnected" if self.cancelled.is_set() else "Deadline exceeded")
+
+
+# Ticket of the request the current thread is working for (read by the generation layer)
+current_ticket: ContextVar[Ticket | None] = ContextVar("current_ticket", default=None)
+
+
+class AdmissionController:
+    """Per-model concurrency limits and outstanding-cost budgets, with deadline-aware rejection."""
+
+    def __init__(self, max_concurrency: int = 1, cost_budget: float = 120.0, cost_model: dict | None = None):
+        self._lock = threading.Lock()
+        self._max_concurrency = max_concurrency
+        self._budget = cost_budget
+        self._cost_model = {**DEFAULT_COST_MODEL, **(cost_model or {})}
+        # Outstanding (queued + running) estimated seconds, slots and estimate correction per model
+        self._outstanding: dict[str, float] = {}
+        self._slots: dict[str, threading.Semaphore] = {}
+        self._scale: dict[str, float] = {}
+
+    def estimate(self, model: str, images: int, max_new_tokens: int) -> float:
+        """Estimated seconds of model time for ``images`` images decoding up to ``max_new_tokens`` tokens in total."""
+        costs = self._cost_model.get(model, DEFAULT_COST_MODEL["gemma"])
+        raw = costs["per_image"] * images + costs["per_token"] * max_new_tokens
+        return raw * self._scale.get(model, 1.0)
+
+    def admit(self, model: str, images: int, max_new_tokens: int, deadline_ms: int | None = None) -> Ticket:
+        cost = self.estimate(model, images, max_new_tokens)
+        deadline = time.monotonic() + deadline_ms / 1000 if deadline_ms else None
+        with self._lock:
+            outstanding = self._outstanding.get(model, 0.0)
+            # Work ahead of us drains roughly in parallel across the model's slots
+            wait = outstanding / self._max_concurrency
+            if outstanding > 0 and outstanding + cost > self._budget:
+                raise AdmissionRejected(f"Model {model} is overloaded", retry_after=wait)
+            if deadline_ms and wait + cost > deadline_ms / 1000:
+                raise AdmissionRejected(
+                    f"Request cannot finish within {deadline_ms} ms (estimated {int((wait + cost) * 1000)} ms)"
+                )
+            self._outstanding[model] = outstanding + cost
+            self._slots.setdefault(model, threading.Semaphore(self._max_concurrency))
+        return Ticket(model=model, cost=cost, deadline=deadline)
+
+    def run(self, ticket: Ticket, fn, *args, **kwargs):
+        """Run ``fn`` in a model slot with ``ticket`` as the current ticket; always releases the admitted cost."""
+        slot = self._slots[ticket.model]
+        try:
+            remaining = ticket.remaining()
+            if not slot.acquire(timeout=max(remaining, 0) if remaining is not None else None):
+                raise RequestCancelled("Deadline exceeded while queued")
+            try:
+                ticket.check()
+                token = current_ticket.set(ticket)
+                start_time = time.monotonic()
+                try:
+                    return fn(*args, **kwargs)
+                finally:
+                    current_ticket.reset(token)
+                    self._observe(ticket, time.monotonic() - start_time - ticket.delegated)
+            finally:
+                slot.release()
+        finally:
+            with self._lock:
+                self._outstanding[ticket.model] = max(0.0, self._outstanding.get(ticket.model, 0.0) - ticket.cost)
+
+    @contextmanager
+    def slot(self, model: str, images: int = 0, max_new_tokens: int = 0):
+        """Hold one of ``model``'s slots inside the current admitted request (e.g. a cascade escalation).
+
+        The estimated cost of the nested work counts against ``model``'s outstanding budget while the slot is held,
+        and its duration refines ``model``'s estimates rather than the admitted model's. Slots are always taken in
+        admitted-model -> other-model order, so nested holds cannot deadlock.
+        """
+        ticket = current_ticket.get()
+        if ticket is None or ticket.model == model:
+            yield
+            return
+        nested = Ticket(model=model, cost=self.estimate(model, images, max_new_tokens), deadline=ticket.deadline,
+                        cancelled=ticket.cancelled)
+        with self._lock:
+            slot = self._slots.setdefault(model, threading.Semaphore(self._max_concurrency))
+            # Charged even past the budget: the request was already admitted, but new ones see the load
+            self._outstanding[model] = self._outstanding.get(model, 0.0) + nested.cost
+        start_time = time.monotonic()
+        try:
+            remaining = ticket.remaining()
+            if not slot.acquire(timeout=max(remaining, 0) if remaining is not None else None):
+                raise RequestCancelled("Deadline exceeded while queued")
+            try:
+                ticket.check()
+                work_start = time.monotonic()
+                try:
+                    yield
+                finally:
+                    self._observe(nested, time.monotonic() - work_start)
+            finally:
+                slot.release()
+        finally:
+            ticket.delegated += time.monotonic() - start_time
+            with self._lock:
+                self._outstanding[model] = max(0.0, self._outstanding.get(model, 0.0) - nested.cost)
+
+    def _observe(self, ticket: Ticket, elapsed: float):
+        if ticket.expired() or ticket.cost <= 0:
+            return
+        with self._lock:
+            # EWMA of actual / estimated keeps the static cost table honest for this host
+            ratio = elapsed / (ticket.cost / self._scale.get(ticket.model, 1.0))
+            self._scale[ticket.model] = 0.8 * self._scale.get(ticket.model, 1.0) + 0.2 * ratio
+
+
+# Singleton controller (limits from env)
+controller = AdmissionController(
+    max_concurrency=settings.ADMISSION_MAX_CONCURRENCY,
+    cost_budget=settings.ADMISSION_COST_BUDGET_SECONDS,
+    cost_model=settings.ADMISSION_COSTS,
+)
@@ -0,0 +1,87 @@
+import logging
+import threading
+
+from prometheus_client import Counter
+
+from app.settings import settings
+
+logger = logging.getLogger(__name__)
+
+# Acceptance metrics (exported at /metrics); acceptance rate = accepted / proposed
+ASSISTED_GENERATIONS = Counter("assisted_generations_total", "Generations run with a draft model", ["model"])
+ASSISTED_TOKENS_PROPOSED = Counter("assisted_draft_tokens_proposed_total", "Draft tokens proposed", ["model"])
+ASSISTED_TOKENS_ACCEPTED = Counter("assisted_draft_tokens_accepted_total", "Draft tokens accepted", ["model"])
+
+_lock = threading.Lock()
+# Draft models by device: (tokenizer, model)
+_assistants: dict = {}
+
+
+def assisted_enabled(family: str) -> bool:
+    return "all" in settings.ASSISTED_DECODING_MODELS or family in settings.ASSISTED_DECODING_MODELS
+
+
+def can_assist(family: str, inputs, generate_kwargs: dict) -> bool:
+    """Assisted decoding is exact only for greedy search, and transformers supports it for batch size 1."""
+    return (
+        assisted_enabled(family)
+        and inputs["input_ids"].shape[0] == 1
+        and not generate_kwargs.get("do_sample")
+        and (generate_kwargs.get("num_beams") or 1) == 1
+    )
+
+
+def get_assistant(device) -> tuple:
+    """Load the draft model on first use, on the same device as the model it assists."""
+    key = str(device)
+    with _lock:
+        if key not in _assistants:
+            from app.models.assistant import initialize_assistant_model
+            logger.info("Loading assistant model %s on %s", settings.ASSISTANT_MODEL_ID, key)
+            _assistants[key] = initialize_assistant_model(settings.ASSISTANT_MODEL_ID, device)
+        return _assistants[key]
+
+
+def _count_calls(module, counter: list):
+    # Only count forwards from this thread (other requests may share the module)
+    thread_id = threading.get_ident()
+
+    def hook(*_):
+        if threading.get_ident() == thread_id:
+            counter[0] += 1
+
+    return module.register_forward_hook(hook)
+
+
+def assisted_generate(family: str, model, inputs, processor, generate_kwargs: dict):
+    """Greedy ``model.generate`` with draft tokens proposed by the assistant model and verified in one forward pass.
+
+    The draft model is text-only and its vocabulary lacks the image tokens, so both tokenizers are passed: transformers
+    then re-tokenizes the decoded prompt (special image tokens dropped) for the draft, and maps its proposals back.
+    """
+    assistant_tokenizer, assistant = get_assistant(model.device)
+    kwargs = {k: v for k, v in generate_kwargs.items() if k not in ("cache_implementation", "disable_compile")}
+    kwargs.update(
+        assistant_model=assistant,
+        tokenizer=getattr(processor, "tokenizer", processor),
+        assistant_tokenizer=assistant_tokenizer,
+        num_assistant_tokens=settings.ASSISTED_NUM_TOKENS,
+        # Fixed lookahead, as configured (the heuristic schedule drifts with acceptance)
+        num_assistant_tokens_schedule="constant",
+    )
+
+    main_steps, draft_steps = [0], [0]
+    handles = [_count_calls(model, main_steps), _count_calls(assistant, draft_steps)]
+    try:
+        output = model.generate(**inputs, **kwargs)
+    finally:
+        for handle in handles:
+            handle.remove()
+
+    sequences = output.sequences if hasattr(output, "sequences") else output
+    new_tokens = sequences.shape[-1] - inputs["input_ids"].shape[-1]
+    # Every verification pass yields its accepted draft tokens plus one token of its own
+    ASSISTED_GENERATIONS.labels(family).inc()
+    ASSISTED_TOKENS_PROPOSED.labels(family).inc(draft_steps[0])
+    ASSISTED_TOKENS_ACCEPTED.labels(family).inc(max(0, min(new_tokens - main_steps[0], draft_steps[0])))
+    return output
@@ -1,17 +1,39 @@
 import hashlib
-import json
 import logging
 
 from redis import Redis
 
+from app.services.disk_cache import DiskCache, get_disk_cache
+from app.services.serialization import Serializer
+from app.settings import settings
+
 logger = logging.getLogger(__name__)
 
+_default_serializer: Serializer | None = None
+
+
+def get_serializer() -> Serializer:
+    """Process-wide serializer configured from settings."""
+    global _default_serializer
+    if _default_serializer is None:
+        _default_serializer = Serializer(
+            fmt=settings.CACHE_SERIALIZER,
+            compression=settings.CACHE_COMPRESSION,
+            min_compress_bytes=settings.CACHE_COMPRESSION_MIN_BYTES,
+        )
+    return _default_serializer
+
 
 class Cache:
-    def __init__(self, client: Redis, ttl: int = 24 * 3600, prefix: str = "v1"):
+    """Redis-backed result cache with an optional local disk tier (consulted on Redis misses, then backfilled)."""
+
+    def __init__(self, client: Redis, ttl: int = 24 * 3600, prefix: str = "v1", serializer: Serializer | None = None,
+                 disk: DiskCache | None = None):
         self.r = client
         self.ttl = ttl
         self.prefix = prefix
+        self.serializer = serializer or get_serializer()
+        self.disk = disk if disk is not None else get_disk_cache()
 
     # Compose a namespaced key for a single-image caption cache
     def img_key(self, sha: str) -> str:
@@ -21,22 +43,72 @@ class Cache:
     def collection_key(self, sha: str) -> str:
         return f"{self.prefix}:collection:{sha}"
 
+    # Compose a namespaced key for a per-image intermediate artifact (e.g. flag verdict, short caption).
+    # Artifacts depend on the model and prompt that produced them, so both are part of the key.
+    def artifact_key(self, kind: str, sha: str, model: str, prompt: str | None = None) -> str:
+        key = f"{self.prefix}:artifact:{kind}:{model}:{sha}"
+        if prompt:
+            key = f"{key}:{self.hash_bytes(prompt.encode('utf-8'))[:16]}"
+        return key
+
     # Safe get that tolerates Redis outages (returns None)
     def get_json(self, key: str):
+        return self.get_many_json([key])[0]
+
+    # Batched safe get (single round-trip per tier); missing or unreadable entries come back as None
+    def get_many_json(self, keys: list[str]) -> list:
+        results = []
+        for key, val in zip(keys, self._get_many_raw(keys)):
+            try:
+                results.append(self.serializer.loads(val) if val else None)
+            except ValueError:
+                logger.warning("Unable to decode cache key: %s", key)
+                results.append(None)
+        return results
+
+    # Cached value as JSON text (bytes), without building Python objects when it is stored as JSON
+    def get_raw_json(self, key: str) -> bytes | None:
+        return self.get_many_raw_json([key])[0]
+
+    def get_many_raw_json(self, keys: list[str]) -> list[bytes | None]:
+        results = []
+        for key, val in zip(keys, self._get_many_raw(keys)):
+            try:
+                results.append(self.serializer.to_json(val) if val else None)
+            except ValueError:
+                logger.warning("Unable to decode cache key: %s", key)
+                results.append(None)
+        return results
+
+    def _get_many_raw(self, keys: list[str]) -> list:
+        if not keys:
+            return []
         try:
-            val = self.r.get(key)
-            return json.loads(val) if val else None
+            values = self.r.mget(keys)
         except Exception:
-            logger.warning("Unable to retrieve cache key: %s", key)
-            return None
+            logger.warning("Unable to retrieve %d cache keys", len(keys))
+            values = [None] * len(keys)
+        if self.disk is not None and not all(values):
+            missing = [i for i, val in enumerate(values) if not val]
+            for i, val in zip(missing, self.disk.get_many([keys[i] for i in missing])):
+                if val:
+                    values[i] = val
+                    # Restore the entry Redis evicted (or lost in a restart)
+                    self._redis_set(keys[i], val)
+        return values
 
     # Safe set that tolerates Redis outages (best-effort cache)
     def set_json(self, key: str, value: dict):
+        data = self.serializer.dumps(value)
+        self._redis_set(key, data)
+        if self.disk is not None:
+            self.disk.set(key, data, self.ttl)
+
+    def _redis_set(self, key: str, data: bytes):
         try:
-            self.r.set(key, json.dumps(value), ex=self.ttl)
+            self.r.set(key, data, ex=self.ttl)
         except Exception:
             logger.warning("Unable to store cache key: %s", key)
-            pass
 
     # Hash raw bytes deterministically (used for cache keys)
     @staticmethod
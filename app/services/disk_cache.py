@@ -0,0 +1,146 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from app.settings import settings
+
+logger = logging.getLogger(__name__)
+
+# Lock waits (ms): writes queue behind other workers, access-time bookkeeping gives up almost immediately
+BUSY_TIMEOUT_MS = 5000
+BOOKKEEPING_TIMEOUT_MS = 50
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    value BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    expires REAL NOT NULL,
+    accessed REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed);
+"""
+
+
+class DiskCache:
+    """Persistent, size-bounded local cache tier (SQLite, memory-mapped reads, LRU pruning).
+
+    Survives process restarts and Redis evictions; safe to share between the workers of one host (WAL mode).
+    Values are opaque bytes (already serialized by ``Cache``).
+    """
+
+    def __init__(self, path: str, max_bytes: int = 1024 * 1024 * 1024, prune_every: int = 256):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._prune_every = prune_every
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._lock:
+            self._conn().executescript(_SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        # One connection per thread (sqlite3 connections must not be shared across threads)
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT_MS / 1000, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            # Reads come straight from the page cache instead of read() copies
+            conn.execute(f"PRAGMA mmap_size={int(self.max_bytes * 1.25)}")
+            self._local.conn = conn
+        return conn
+
+    def get_many(self, keys: list[str]) -> list[bytes | None]:
+        if not keys:
+            return []
+        now = time.time()
+        try:
+            conn = self._conn()
+            placeholders = ",".join("?" * len(keys))
+            rows = dict(conn.execute(
+                f"SELECT key, value FROM entries WHERE key IN ({placeholders}) AND expires > ?", (*keys, now)
+            ).fetchall())
+        except sqlite3.Error:
+            logger.warning("Unable to read %d keys from disk cache", len(keys))
+            return [None] * len(keys)
+        if rows:
+            self._touch(conn, list(rows), now)
+        return [rows.get(key) for key in keys]
+
+    def _touch(self, conn: sqlite3.Connection, keys: list[str], now: float):
+        # LRU bookkeeping; a failed update only makes pruning slightly less accurate, so never wait on the write lock
+        conn.execute(f"PRAGMA busy_timeout = {BOOKKEEPING_TIMEOUT_MS}")
+        try:
+            conn.execute(f"UPDATE entries SET accessed = ? WHERE key IN ({','.join('?' * len(keys))})", (now, *keys))
+        except sqlite3.Error:
+            logger.debug("Skipped disk cache access-time update for %d keys", len(keys))
+        finally:
+            conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+
+    def get(self, key: str) -> bytes | None:
+        return self.get_many([key])[0]
+
+    def set(self, key: str, value: bytes, ttl: int):
+        now = time.time()
+        try:
+            self._conn().execute(
+                "INSERT OR REPLACE INTO entries (key, value, size, expires, accessed) VALUES (?, ?, ?, ?, ?)",
+                (key, value, len(value) + len(key), now + ttl, now),
+            )
+        except sqlite3.Error:
+            logger.warning("Unable to store key in disk cache: %s", key)
+            return
+        with self._lock:
+            self._writes += 1
+            prune = self._writes % self._prune_every == 0
+        if prune:
+            self.prune()
+
+    def prune(self):
+        """Drop expired entries, then least recently used ones until the tier is back under 90% of its budget."""
+        try:
+            conn = self._conn()
+            conn.execute("DELETE FROM entries WHERE expires <= ?", (time.time(),))
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+            if total <= self.max_bytes:
+                return
+            excess = total - int(self.max_bytes * 0.9)
+            # Walk entries oldest-first and find the access time that frees enough bytes
+            freed, cutoff = 0, None
+            cursor = conn.execute("SELECT size, accessed FROM entries ORDER BY accessed")
+            for size, accessed in cursor:
+                freed += size
+                cutoff = accessed
+                if freed >= excess:
+                    break
+            cursor.close()
+            if cutoff is not None:
+                conn.execute("DELETE FROM entries WHERE accessed <= ?", (cutoff,))
+                logger.info("Pruned disk cache: %d bytes over budget", excess)
+        except sqlite3.Error:
+            logger.warning("Unable to prune disk cache")
+
+    def clear(self):
+        try:
+            self._conn().execute("DELETE FROM entries")
+        except sqlite3.Error:
+            logger.warning("Unable to clear disk cache")
+
+
+_disk_cache: DiskCache | None = None
+_disk_cache_lock = threading.Lock()
+
+
+def get_disk_cache() -> DiskCache | None:
+    """Get or create the process-wide disk cache tier (None when CACHE_DISK_PATH is unset)."""
+    global _disk_cache
+    if not settings.CACHE_DISK_PATH:
+        return None
+    with _disk_cache_lock:
+        if _disk_cache is None:
+            _disk_cache = DiskCache(settings.CACHE_DISK_PATH, max_bytes=settings.CACHE_DISK_MAX_BYTES)
+        return _disk_cache
@@ -0,0 +1,126 @@
+import logging
+import threading
+import time
+from multiprocessing.connection import Client
+
+import torch
+import torch.multiprocessing
+
+from app.services.admission import current_ticket, RequestCancelled
+from app.settings import settings
+
+logger = logging.getLogger(__name__)
+
+
+def enable_shared_tensor_transport():
+    """Pickle tensors as shared-memory handles (by file name) so unrelated processes can map them without copying."""
+    torch.multiprocessing.set_sharing_strategy("file_system")
+
+
+class ModelServerError(RuntimeError):
+    """Raised when the model server rejects or fails a request."""
+
+
+# How often a thread waiting on the server checks whether its request was cancelled (seconds)
+CANCEL_POLL_INTERVAL = 0.1
+
+
+class _ConnectionPool:
+    """Lazily opened client connections of one HTTP worker process; each in-flight request holds its own."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._idle = []
+
+    def _connect(self):
+        deadline = time.monotonic() + settings.MODEL_SERVER_CONNECT_TIMEOUT
+        while True:
+            try:
+                return Client(settings.MODEL_SERVER_ADDRESS, family="AF_UNIX",
+                              authkey=settings.MODEL_SERVER_AUTHKEY.encode("utf-8"))
+            except (FileNotFoundError, ConnectionRefusedError):
+                # The server may still be loading models
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.5)
+
+    def request(self, message: dict, ticket=None):
+        for attempt in (1, 2):
+            with self._lock:
+                conn = self._idle.pop() if self._idle else None
+            if conn is None:
+                conn = self._connect()
+            try:
+                conn.send(message)
+                response = self._wait(conn, ticket)
+                break
+            except (EOFError, OSError):
+                # Server restarted: reconnect once
+                conn.close()
+                if attempt == 2:
+                    raise
+        with self._lock:
+            self._idle.append(conn)
+        if response.get("cancelled"):
+            raise RequestCancelled(response.get("error", "Deadline exceeded"))
+        if not response.get("ok"):
+            raise ModelServerError(response.get("error", "Model server error"))
+        return response["result"]
+
+    @staticmethod
+    def _wait(conn, ticket):
+        # Forward a client disconnect / passed deadline so the server stops decoding (or skips the queued job)
+        cancel_sent = False
+        while not conn.poll(CANCEL_POLL_INTERVAL):
+            if ticket is not None and not cancel_sent and ticket.expired():
+                conn.send({"op": "cancel"})
+                cancel_sent = True
+        return conn.recv()
+
+
+_connections = _ConnectionPool()
+
+
+class RemoteModel:
+    """Stand-in for a model hosted by the model server process.
+
+    HTTP workers keep the processor (tokenize, preprocess, decode) and hand the resulting CPU tensors to the server
+    through shared memory; ``app.inference.generation`` routes ``generate`` / forward calls here.
+    """
+
+    device = torch.device("cpu")
+
+    def __init__(self, key: str):
+        self.family = key
+        self.name_or_path = key
+        enable_shared_tensor_transport()
+
+    def _call(self, op: str, inputs, image_keys, kwargs: dict | None = None):
+        ticket = current_ticket.get()
+        if ticket is not None:
+            ticket.check()
+        return _connections.request({
+            "op": op,
+            "model": self.family,
+            "inputs": {k: v for k, v in inputs.items()},
+            "image_keys": image_keys,
+            "kwargs": kwargs or {},
+            # Remaining seconds; the server enforces it between tokens (disconnects arrive as a cancel message)
+            "deadline": ticket.remaining() if ticket is not None else None,
+        }, ticket)
+
+    def generate(self, inputs, image_keys: list[str] | None = None, **generate_kwargs) -> torch.Tensor:
+        return self._call("generate", inputs, image_keys, generate_kwargs)
+
+    def generate_scored(self, inputs, image_keys: list[str] | None = None, **generate_kwargs):
+        return self._call("generate_scored", inputs, image_keys, generate_kwargs)
+
+    def forward_logits(self, inputs, image_keys: list[str] | None = None) -> torch.Tensor:
+        return self._call("forward_logits", inputs, image_keys)
+
+    # Registry hooks expect a torch module
+    def eval(self):
+        return self
+
+    def cpu(self):
+        return self
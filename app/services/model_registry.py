@@ -2,8 +2,9 @@ import gc
 import logging
 import os
 import threading
-from collections import OrderedDict
-from typing import Tuple, Union, TYPE_CHECKING
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+from typing import Iterator, Tuple, Union, TYPE_CHECKING
 
 import torch
 
@@ -16,9 +17,10 @@ if TYPE_CHECKING:
         InternVLProcessor, InternVLForConditionalGeneration
     )
 
-from app.models.blip import initialize_blip_model, initialize_blip2_model
-from app.models.gemma import initialize_gemma_model
-from app.models.intern_vlm import initialize_intern_vlm_model
+from app.services import static_cache
+from app.services.model_client import RemoteModel
+from app.services.optimization import configure_torch_threads, optimization_enabled, optimize_model
+from app.settings import settings
 
 # Allowed model keys (validate early for clearer errors)
 ALLOWED_MODELS = {"blip", "blip2", "gemma", "intern_vlm"}
@@ -40,36 +42,114 @@ else:
 logger = logging.getLogger(__name__)
 
 
-# Internal factory to load a model by key
+# Internal factory to load a model by key (model modules are imported here, on first load of their family)
 def _load_model(key: str) -> ModelTuple:
     if key == "blip2":
+        from app.models.blip import initialize_blip2_model
         return initialize_blip2_model()
     if key == "gemma":
+        from app.models.gemma import initialize_gemma_model
         return initialize_gemma_model()
     if key == "intern_vlm":
+        from app.models.intern_vlm import initialize_intern_vlm_model
         return initialize_intern_vlm_model()
+    from app.models.blip import initialize_blip_model
     return initialize_blip_model()
 
 
+# Internal factory for remote mode: processor only, the weights live in the model server
+def _load_remote_model(key: str) -> ModelTuple:
+    if key == "blip2":
+        from app.models.blip import initialize_blip2_processor
+        processor = initialize_blip2_processor()
+    elif key == "gemma":
+        from app.models.gemma import initialize_gemma_processor
+        processor = initialize_gemma_processor()
+    elif key == "intern_vlm":
+        from app.models.intern_vlm import initialize_intern_vlm_processor
+        processor = initialize_intern_vlm_processor()
+    else:
+        from app.models.blip import initialize_blip_processor
+        processor = initialize_blip_processor()
+    return processor, RemoteModel(key), "cpu"
+
+
 class ModelRegistry:
-    def __init__(self, max_models_loaded: int = 1):
+    def __init__(self, max_models_loaded: int = 1, remote: bool = False):
         # Re-entrant lock for thread-safety (API workers may be multi-threaded)
         self._lock = threading.RLock()
+        # Signalled when a lease is released, so a pending eviction can re-check its victim
+        self._released = threading.Condition(self._lock)
         # LRU cache: key -> (processor, model, device)
         self._cache: 'OrderedDict[str, ModelTuple]' = OrderedDict()
         self._max = max_models_loaded
+        # Active leases per key (process-wide) and per thread; leased models are never evicted
+        self._leases: Counter = Counter()
+        self._held = threading.local()
+        # Keys an eviction is waiting on: no new leases until they are gone, so the eviction cannot starve
+        self._draining: set[str] = set()
+        # Remote mode: hand out processors + RemoteModel proxies backed by the model server process
+        self.remote = remote
+
+    def _held_keys(self) -> Counter:
+        if not hasattr(self._held, "keys"):
+            self._held.keys = Counter()
+        return self._held.keys
+
+    @contextmanager
+    def lease(self, key: str) -> Iterator[ModelTuple]:
+        """Get ``key`` and keep it loaded until the block exits; loading another model waits for it to be released.
+
+        Do not lease a second model while holding a lease: with a capacity of one that would wait on itself.
+        """
+        held = self._held_keys()
+        with self._released:
+            # A model being drained finishes its in-flight calls and is evicted first (unless this thread holds it)
+            while key in self._draining and not held[key]:
+                self._released.wait()
+            entry = self.get(key)
+            self._leases[key] += 1
+        held[key] += 1
+        try:
+            yield entry
+        finally:
+            held[key] -= 1
+            with self._released:
+                self._leases[key] -= 1
+                self._released.notify_all()
 
     def get(self, key: str) -> ModelTuple:
         if key not in ALLOWED_MODELS:
             # Fail-fast on invalid user input
             raise ValueError("Invalid model key")
         with self._lock:
-            # Fast path: cache hit => refresh LRU ordering
-            if key in self._cache:
-                processor, model, device = self._cache.pop(key)
-                self._cache[key] = (processor, model, device)
-                return processor, model, device
             # Cache miss: load model lazily
+            if self.remote and key not in self._cache:
+                self._cache[key] = _load_remote_model(key)
+            draining = []
+            try:
+                while True:
+                    # Fast path: cache hit => refresh LRU ordering
+                    if key in self._cache:
+                        processor, model, device = self._cache.pop(key)
+                        self._cache[key] = (processor, model, device)
+                        return processor, model, device
+                    if len(self._cache) < self._max:
+                        break
+                    # Make room before loading (free memory, including GPU), oldest first
+                    victim = next(iter(self._cache))
+                    if not self._leases[victim]:
+                        self._evict(victim)
+                        continue
+                    if self._held_keys()[victim]:
+                        raise RuntimeError(f"Cannot load model {key} while this thread holds a lease on {victim}")
+                    # Wait for in-flight calls on the victim to finish
+                    self._draining.add(victim)
+                    draining.append(victim)
+                    self._released.wait()
+            finally:
+                self._draining.difference_update(draining)
+                self._released.notify_all()
             processor, model, device = _load_model(key)
             try:
                 # Inference mode (disable dropout, etc.)
@@ -78,25 +158,33 @@ class ModelRegistry:
                 # Some models may not expose eval(); ignore quietly
                 logger.warning("Unable to set model to eval mode for model: %s; skipping", key)
                 pass
+            # Opt-in optimized execution (inference_mode, SDPA, compile); self-checks and falls back on failure
+            if optimization_enabled(key):
+                optimize_model(key, processor, model, device)
             # Add to LRU
             self._cache[key] = (processor, model, device)
-            # Evict oldest until under capacity (free memory, including GPU)
-            while len(self._cache) > self._max:
-                k, (p, m, d) = self._cache.popitem(last=False)
-                try:
-                    # Move evicted model weights off GPU if possible
-                    m.cpu()
-                except Exception:
-                    logger.warning("Unable to move model weights off GPU for model: %s; skipping", k)
-                    pass
-                # Drop strong refs to help GC
-                del p, m
-                gc.collect()
-                if torch.cuda.is_available():
-                    # Return freed memory back to CUDA allocator
-                    torch.cuda.empty_cache()
             return processor, model, device
 
+    def _evict(self, key: str):
+        p, m, d = self._cache.pop(key)
+        try:
+            # Move evicted model weights off GPU if possible
+            m.cpu()
+        except Exception:
+            logger.warning("Unable to move model weights off GPU for model: %s; skipping", key)
+            pass
+        # Pooled KV caches are shaped for this model; release them with it
+        static_cache.pool.clear(m)
+        # Drop strong refs to help GC
+        del p, m
+        gc.collect()
+        if torch.cuda.is_available():
+            # Return freed memory back to CUDA allocator
+            torch.cuda.empty_cache()
+
+
+# CPU thread tuning applies process-wide, before any model work
+configure_torch_threads()
 
 # Singleton registry (capacity from env)
-registry = ModelRegistry(max_models_loaded=int(os.getenv("MODEL_CAPACITY", 1)))
+registry = ModelRegistry(max_models_loaded=int(os.getenv("MODEL_CAPACITY", 1)), remote=settings.MODEL_SERVER_ENABLED)
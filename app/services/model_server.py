@@ -0,0 +1,253 @@
+"""Local model server: owns the ModelRegistry and runs all model calls for the HTTP workers on this host/device.
+
+Run with ``python -m app.services.model_server`` (gunicorn spawns it when MODEL_SERVER_ENABLED=true).
+"""
+import logging
+import os
+import queue
+import threading
+import time
+from collections import deque
+from multiprocessing.connection import Listener
+
+import torch
+
+from app.inference.generation import generate, generate_scored, forward_logits
+from app.services.admission import current_ticket, RequestCancelled, Ticket
+from app.services.assisted import can_assist
+from app.services.model_client import enable_shared_tensor_transport
+from app.services.model_registry import registry
+from app.services.warmup import warm_up
+from app.settings import settings
+
+logger = logging.getLogger(__name__)
+
+_OPS = {"generate", "generate_scored", "forward_logits", "ping"}
+# Ops whose compatible requests (same model, op, kwargs and per-row input shapes) share one model call
+_BATCHED_OPS = {"generate", "generate_scored", "forward_logits"}
+# How often a connection waiting on its result checks for a cancel message (seconds)
+CANCEL_POLL_INTERVAL = 0.1
+
+
+class _Job:
+    """One client request waiting in (or running from) the executor queue."""
+
+    def __init__(self, request: dict):
+        self.request = request
+        self.reply: 'queue.Queue' = queue.Queue(maxsize=1)
+        deadline = request.get("deadline")
+        self.ticket = Ticket(model=request.get("model"), cost=0.0,
+                             deadline=time.monotonic() + deadline if deadline is not None else None)
+        self.batch_key = _batch_key(request)
+
+
+class _BatchTicket(Ticket):
+    """Ticket of a merged model call: decoding stops only once every member request has gone away."""
+
+    def __init__(self, members: list[Ticket]):
+        super().__init__(model=members[0].model, cost=0.0)
+        self.members = members
+
+    def remaining(self) -> float | None:
+        remaining = [ticket.remaining() for ticket in self.members]
+        return None if None in remaining else max(remaining)
+
+    def expired(self) -> bool:
+        return all(ticket.expired() for ticket in self.members)
+
+
+def _rows(inputs: dict) -> int:
+    # Sequences are counted by the prompts; a multi-image prompt has several pixel rows
+    return (inputs["input_ids"] if "input_ids" in inputs else inputs["pixel_values"]).shape[0]
+
+
+def _batch_key(request: dict):
+    """Requests with equal keys (and equal kwargs) can be concatenated along the batch dimension; None = run alone."""
+    inputs, kwargs = request.get("inputs") or {}, request.get("kwargs") or {}
+    if request.get("op") not in _BATCHED_OPS or settings.MODEL_SERVER_MAX_BATCH <= 1:
+        return None
+    if not inputs or not all(torch.is_tensor(v) for v in inputs.values()):
+        return None
+    if "input_ids" not in inputs and "pixel_values" not in inputs:
+        return None
+    if (kwargs.get("num_return_sequences") or 1) != 1:
+        return None
+    if "input_ids" in inputs and can_assist(request["model"], inputs, kwargs):
+        # Draft-model decoding only runs on single sequences; merging would turn it off
+        return None
+    # Equal per-row shapes: no re-padding, so each request decodes exactly as it would alone
+    shapes = tuple(sorted((name, tuple(value.shape[1:]), value.dtype) for name, value in inputs.items()))
+    return request["model"], request["op"], shapes
+
+
+def _compatible(first: _Job, job: _Job) -> bool:
+    if job.batch_key is None or job.batch_key != first.batch_key:
+        return False
+    try:
+        return job.request["kwargs"] == first.request["kwargs"]
+    except Exception:
+        return False
+
+
+def _merge(jobs: list[_Job]) -> dict:
+    requests = [job.request for job in jobs]
+    keys = [request["image_keys"] for request in requests]
+    return {
+        **requests[0],
+        "inputs": {name: torch.cat([request["inputs"][name] for request in requests])
+                   for name in requests[0]["inputs"]},
+        # Each request's keys follow its own pixel rows, so the concatenation lines up with the merged pixels
+        "image_keys": [key for request_keys in keys for key in request_keys] if None not in keys else None,
+    }
+
+
+def _split(op: str, result, jobs: list[_Job]) -> list:
+    sizes = [_rows(job.request["inputs"]) for job in jobs]
+    if op == "generate_scored":
+        sequences, confidences = result
+        offsets = [sum(sizes[:i]) for i in range(len(sizes))]
+        return [(part, confidences[offset:offset + size])
+                for part, offset, size in zip(sequences.split(sizes), offsets, sizes)]
+    return list(result.split(sizes))
+
+
+def _execute(request: dict, ticket: Ticket | None = None):
+    if request["op"] == "ping":
+        return "pong"
+    with registry.lease(request["model"]) as (processor, model, _):
+        inputs = {k: v.to(model.device) if torch.is_tensor(v) else v for k, v in request["inputs"].items()}
+        token = current_ticket.set(ticket)
+        try:
+            if request["op"] == "generate":
+                result = generate(model, inputs, processor, request["image_keys"], **request["kwargs"])
+            elif request["op"] == "generate_scored":
+                sequences, confidences = generate_scored(model, inputs, processor, request["image_keys"],
+                                                         **request["kwargs"])
+                return sequences.cpu(), confidences
+            else:
+                result = forward_logits(model, inputs, processor, request["image_keys"])
+        finally:
+            current_ticket.reset(token)
+    # Results travel back through shared memory as well
+    return result.cpu()
+
+
+def _run_jobs(jobs: 'queue.Queue'):
+    # Single executor: model calls are serialised in arrival order, one device, one stream of work. Requests queued
+    # behind the oldest one join its call when they are compatible, so more HTTP workers mean larger batches.
+    pending: 'deque[_Job]' = deque()
+    while True:
+        if not pending:
+            pending.append(jobs.get())
+        while True:
+            try:
+                pending.append(jobs.get_nowait())
+            except queue.Empty:
+                break
+        first = pending.popleft()
+        batch = [first]
+        if first.batch_key is not None:
+            for job in list(pending):
+                if len(batch) >= settings.MODEL_SERVER_MAX_BATCH:
+                    break
+                if _compatible(first, job):
+                    pending.remove(job)
+                    batch.append(job)
+        _run_batch(batch)
+
+
+def _run_batch(batch: list[_Job]):
+    live = []
+    for job in batch:
+        # Cancelled or expired while queued: skip the model work altogether
+        if job.ticket.expired():
+            job.reply.put({"ok": False, "cancelled": True, "error": "Cancelled while queued"})
+        else:
+            live.append(job)
+    if not live:
+        return
+    op = live[0].request["op"]
+    try:
+        if len(live) == 1:
+            results = [_execute(live[0].request, live[0].ticket)]
+        else:
+            logger.info("Batching %d %s requests for %s", len(live), op, live[0].request["model"])
+            results = _split(op, _execute(_merge(live), _BatchTicket([job.ticket for job in live])), live)
+    except RequestCancelled as exc:
+        for job in live:
+            job.reply.put({"ok": False, "cancelled": True, "error": str(exc)})
+        return
+    except Exception as exc:
+        logger.exception("Model server request failed: %s", op)
+        for job in live:
+            job.reply.put({"ok": False, "error": f"{type(exc).__name__}: {exc}"})
+        return
+    for job, result in zip(live, results):
+        # A member that went away while a merged call kept running gets no (possibly truncated) result
+        if job.ticket.expired():
+            job.reply.put({"ok": False, "cancelled": True, "error": "Cancelled"})
+        else:
+            job.reply.put({"ok": True, "result": result})
+
+
+def _serve_connection(conn, jobs: 'queue.Queue'):
+    with conn:
+        while True:
+            try:
+                request = conn.recv()
+            except (EOFError, OSError):
+                return
+            if request.get("op") == "cancel":
+                # Sent just as its request finished; nothing left to cancel
+                continue
+            if request.get("op") not in _OPS:
+                conn.send({"ok": False, "error": f"Unknown op: {request.get('op')}"})
+                continue
+            job = _Job(request)
+            jobs.put(job)
+            # While the job waits or runs, the client may send a cancel (its HTTP client disconnected)
+            while True:
+                try:
+                    response = job.reply.get(timeout=CANCEL_POLL_INTERVAL)
+                    break
+                except queue.Empty:
+                    pass
+                try:
+                    if conn.poll() and conn.recv().get("op") == "cancel":
+                        job.ticket.cancelled.set()
+                except (EOFError, OSError):
+                    # Worker went away: stop generating for it
+                    job.ticket.cancelled.set()
+                    return
+            conn.send(response)
+
+
+def serve(address: str | None = None):
+    address = address or settings.MODEL_SERVER_ADDRESS
+    if not settings.MODEL_SERVER_AUTHKEY:
+        raise RuntimeError("MODEL_SERVER_AUTHKEY is not set; start the server via gunicorn_conf or set a key")
+    enable_shared_tensor_transport()
+    # This process hosts the models itself, whatever MODEL_SERVER_ENABLED says for the HTTP workers
+    registry.remote = False
+    for key in settings.WARMUP_MODELS:
+        logger.info("Warming up model: %s", key)
+        warm_up(key)
+
+    if os.path.exists(address):
+        os.remove(address)
+    jobs: 'queue.Queue' = queue.Queue()
+    threading.Thread(target=_run_jobs, args=(jobs,), name="model-server-executor", daemon=True).start()
+    with Listener(address, family="AF_UNIX", authkey=settings.MODEL_SERVER_AUTHKEY.encode("utf-8")) as listener:
+        logger.info("Model server listening on %s (pid=%d)", address, os.getpid())
+        while True:
+            try:
+                conn = listener.accept()
+            except Exception:
+                logger.warning("Rejected model server connection")
+                continue
+            threading.Thread(target=_serve_connection, args=(conn, jobs), daemon=True).start()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s %(message)s")
+    serve()
@@ -0,0 +1,111 @@
+import logging
+import time
+import weakref
+
+import torch
+from PIL import Image
+
+from app.services import static_cache
+from app.settings import settings
+
+logger = logging.getLogger(__name__)
+
+# Models currently running in optimized mode (weak so evicted models drop out)
+_optimized: 'weakref.WeakSet' = weakref.WeakSet()
+_threads_configured = False
+
+
+def optimization_enabled(key: str) -> bool:
+    return "all" in settings.OPTIMIZED_MODELS or key in settings.OPTIMIZED_MODELS
+
+
+def is_optimized(model) -> bool:
+    return model in _optimized
+
+
+def execution_context(model):
+    """Grad-free context for running ``model``: ``inference_mode`` when optimized, ``no_grad`` otherwise."""
+    return torch.inference_mode() if is_optimized(model) else torch.no_grad()
+
+
+def configure_torch_threads(num_threads: int | None = None, num_interop_threads: int | None = None):
+    """Apply CPU intra-/inter-op thread counts (settings by default; 0 keeps the torch default)."""
+    global _threads_configured
+    num_threads = settings.TORCH_NUM_THREADS if num_threads is None else num_threads
+    num_interop_threads = settings.TORCH_NUM_INTEROP_THREADS if num_interop_threads is None else num_interop_threads
+    if num_threads > 0:
+        torch.set_num_threads(num_threads)
+    if num_interop_threads > 0 and not _threads_configured:
+        try:
+            # Only settable once, before any inter-op parallel work has started
+            torch.set_num_interop_threads(num_interop_threads)
+        except RuntimeError:
+            logger.warning("Unable to set inter-op threads to %d; keeping %d", num_interop_threads,
+                           torch.get_num_interop_threads())
+    _threads_configured = True
+    logger.info("Torch threads: intra-op=%d inter-op=%d", torch.get_num_threads(), torch.get_num_interop_threads())
+
+
+def _compile_targets(model):
+    """Modules whose forward is worth compiling: the vision encoder everywhere, BLIP's small text decoder too.
+
+    Gemma / InternVLM decoders are compiled by transformers itself on the static-cache path (STATIC_CACHE_COMPILE).
+    """
+    inner = getattr(model, "model", None)
+    if inner is not None and hasattr(inner, "vision_tower"):
+        return [(inner.vision_tower, False)]
+    targets = []
+    if hasattr(model, "vision_model"):
+        targets.append((model.vision_model, False))
+    if hasattr(model, "text_decoder"):
+        # Sequence length grows every step: compile once with dynamic shapes
+        targets.append((model.text_decoder, True))
+    return targets
+
+
+def optimize_model(key: str, processor, model, device: str) -> bool:
+    """Switch a freshly loaded model to optimized execution, falling back to plain eager mode if the self-check fails.
+
+    Optimized mode means ``inference_mode`` around every call, SDPA attention where the architecture supports it, and
+    ``torch.compile``-d vision encoder (plus BLIP's text decoder) when ``OPTIMIZE_COMPILE`` is on.
+    """
+    original_attn = getattr(model.config, "_attn_implementation", None)
+    try:
+        model.set_attn_implementation("sdpa")
+    except Exception as exc:
+        logger.info("SDPA attention not available for model %s (%s); keeping %s", key, exc, original_attn)
+
+    compiled = []
+    if settings.OPTIMIZE_COMPILE:
+        for module, dynamic in _compile_targets(model):
+            module.forward = torch.compile(module.forward, dynamic=dynamic)
+            compiled.append(module)
+
+    _optimized.add(model)
+    try:
+        _self_check(processor, model, device)
+        logger.info("Optimized execution enabled for model: %s (compiled modules=%d)", key, len(compiled))
+        return True
+    except Exception:
+        logger.exception("Optimized execution self-check failed for model: %s; falling back to eager mode", key)
+        _optimized.discard(model)
+        for module in compiled:
+            del module.forward
+        if original_attn and getattr(model.config, "_attn_implementation", None) != original_attn:
+            try:
+                model.set_attn_implementation(original_attn)
+            except Exception:
+                logger.warning("Unable to restore attention implementation for model: %s", key)
+        # Caches allocated under inference_mode cannot be reset outside it
+        static_cache.pool.clear(model)
+        return False
+
+
+def _self_check(processor, model, device: str):
+    # Imported here: captioning depends on this module for execution_context
+    from app.inference.captioning import infer_image_caption
+
+    start_time = time.time()
+    # Exercises preprocessing, (compiled) vision encoder and a couple of decode steps
+    infer_image_caption(processor, model, device, Image.new("RGB", (64, 64), color=(127, 127, 127)), max_new_tokens=2)
+    logger.info("Self-check passed in %.1fs", time.time() - start_time)
@@ -0,0 +1,39 @@
+import gc
+import logging
+import os
+
+from app.services.model_registry import registry
+from app.services.optimization import configure_torch_threads
+from app.settings import settings
+
+logger = logging.getLogger(__name__)
+
+
+def preload_models(keys: list[str]):
+    """Load models in the Gunicorn master so forked workers share the weight pages instead of loading their own.
+
+    Parameters move to shared memory (``Module.share_memory``), so pages stay shared even if something writes to
+    them. The loaded objects are then frozen out of the cyclic GC, whose header writes would otherwise un-share the
+    pages holding them. CPU only: CUDA cannot be initialised before fork.
+    """
+    from app.models.blip import DEVICE
+
+    if DEVICE != "cpu":
+        logger.warning("Skipping model preload: device is %s (CUDA/MPS state cannot be shared across fork)", DEVICE)
+        return
+    if len(keys) > settings.MODEL_CAPACITY:
+        logger.warning("PRELOAD_MODELS lists %d models but MODEL_CAPACITY=%d; the oldest will be evicted",
+                       len(keys), settings.MODEL_CAPACITY)
+    for key in keys:
+        logger.info("Preloading model in master (pid=%d): %s", os.getpid(), key)
+        _, model, _ = registry.get(key)
+        model.share_memory()
+    gc.collect()
+    gc.freeze()
+
+
+def cap_worker_threads(workers: int):
+    """Give each forked worker an equal share of the cores (unless TORCH_NUM_THREADS pins a value)."""
+    if settings.TORCH_NUM_THREADS > 0 or workers <= 1:
+        return
+    configure_torch_threads(num_threads=max(1, (os.cpu_count() or 1) // workers))
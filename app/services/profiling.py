@@ -0,0 +1,147 @@
+import io
+import logging
+import sys
+import threading
+import time
+import tracemalloc
+import zipfile
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+# One capture per worker at a time: profilers are process-global
+_capture_lock = threading.Lock()
+
+
+class ProfilerBusy(Exception):
+    """Raised when a capture is already running in this worker."""
+
+
+class StackSampler:
+    """Low-overhead sampling profiler: snapshots every thread's Python stack at a fixed interval.
+
+    Output is in collapsed-stack format (``thread;outer;...;inner count``), readable by flamegraph.pl / speedscope.
+    """
+
+    def __init__(self, interval: float = 0.01, exclude: set[int] | None = None):
+        self.interval = interval
+        self.exclude = set(exclude or ())
+        self.samples: Counter = Counter()
+        self.sample_count = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        self.exclude.add(threading.get_ident())
+        while not self._stop.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident in self.exclude:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({code.co_filename}:{frame.f_lineno})")
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self.samples[";".join(reversed(stack))] += 1
+            self.sample_count += 1
+
+    def collapsed(self) -> str:
+        return "\n".join(f"{stack} {count}" for stack, count in self.samples.most_common())
+
+
+def _torch_profiler():
+    # Only profile torch if a model has already pulled it in; a capture must not load it
+    torch = sys.modules.get("torch")
+    if torch is None:
+        return None
+    from torch.profiler import profile, ProfilerActivity, _ExperimentalConfig
+    # By default only the thread that starts the profiler is recorded; requests run on threadpool threads
+    return profile(activities=[ProfilerActivity.CPU],
+                   experimental_config=_ExperimentalConfig(profile_all_threads=True))
+
+
+def _tracemalloc_report(snapshot: 'tracemalloc.Snapshot', limit: int = 50) -> str:
+    snapshot = snapshot.filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    ])
+    lines = [f"Top {limit} allocation sites (live memory at the end of the capture)", ""]
+    for stat in snapshot.statistics("lineno")[:limit]:
+        lines.append(str(stat))
+    lines += ["", f"Top {min(limit, 10)} allocation tracebacks", ""]
+    for stat in snapshot.statistics("traceback")[:min(limit, 10)]:
+        lines.append(f"{stat.count} blocks, {stat.size / 1024:.1f} KiB")
+        lines.extend(f"  {line}" for line in stat.traceback.format())
+    return "\n".join(lines)
+
+
+def capture_profile(seconds: float, sample_interval: float = 0.01, torch_ops: bool = True,
+                    memory: bool = False, tracemalloc_frames: int = 10) -> bytes:
+    """Profile this worker for ``seconds`` while it keeps serving requests; returns a zip archive.
+
+    Parameters
+    ----------
+    seconds : capture duration
+    sample_interval : seconds between Python stack samples
+    torch_ops : record a torch.profiler CPU operator table (skipped when torch is not loaded yet)
+    memory : trace allocations with tracemalloc (off by default: it slows every allocation during the capture)
+    tracemalloc_frames : frames kept per allocation traceback
+
+    Returns
+    -------
+    bytes : zip with ``stacks.collapsed``, ``torch_ops.txt``, ``tracemalloc.txt`` and ``summary.txt``
+    """
+    if not _capture_lock.acquire(blocking=False):
+        raise ProfilerBusy("A profile capture is already running in this worker")
+    try:
+        started_tracemalloc = memory and not tracemalloc.is_tracing()
+        if started_tracemalloc:
+            tracemalloc.start(tracemalloc_frames)
+        profiler = _torch_profiler() if torch_ops else None
+        sampler = StackSampler(sample_interval, exclude={threading.get_ident()})
+
+        start_time = time.time()
+        if profiler is not None:
+            profiler.start()
+        sampler.start()
+        try:
+            time.sleep(seconds)
+        finally:
+            sampler.stop()
+            if profiler is not None:
+                profiler.stop()
+            snapshot = tracemalloc.take_snapshot() if memory and tracemalloc.is_tracing() else None
+            if started_tracemalloc:
+                tracemalloc.stop()
+        elapsed = time.time() - start_time
+
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr("stacks.collapsed", sampler.collapsed())
+            if profiler is not None:
+                archive.writestr("torch_ops.txt", profiler.key_averages().table(
+                    sort_by="self_cpu_time_total", row_limit=50))
+            elif torch_ops:
+                archive.writestr("torch_ops.txt", "torch was not loaded in this worker during the capture\n")
+            if snapshot is not None:
+                archive.writestr("tracemalloc.txt", _tracemalloc_report(snapshot))
+            archive.writestr("summary.txt", "\n".join([
+                f"duration_seconds: {elapsed:.2f}",
+                f"stack_samples: {sampler.sample_count}",
+                f"sample_interval_seconds: {sample_interval}",
+                f"torch_ops: {profiler is not None}",
+                f"tracemalloc: {snapshot is not None}",
+            ]) + "\n")
+        logger.info("Captured %.1fs profile (%d stack samples)", elapsed, sampler.sample_count)
+        return buffer.getvalue()
+    finally:
+        _capture_lock.release()
@@ -0,0 +1,119 @@
+import json
+import logging
+
+try:
+    import orjson
+except ImportError:  # optional: stdlib json is used instead
+    orjson = None
+try:
+    import msgpack
+except ImportError:  # optional: falls back to JSON encoding
+    msgpack = None
+try:
+    import zstandard
+except ImportError:  # optional: values are stored uncompressed
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+# First byte of every encoded value: format version, with the compression flag or-ed in.
+# Legacy entries are plain JSON text and start with "{" / "[" (never one of these bytes).
+FORMAT_JSON = 0x01
+FORMAT_MSGPACK = 0x02
+FLAG_ZSTD = 0x10
+
+
+class SerializationError(ValueError):
+    """Raised for values that cannot be decoded (unknown format, missing optional dependency, corrupt data)."""
+
+
+class Serializer:
+    """Versioned cache value codec: msgpack / JSON (orjson when installed), optionally zstd-compressed.
+
+    Parameters
+    ----------
+    fmt : "msgpack" | "json"; falls back to JSON when msgpack is not installed
+    compression : "zstd" | "none"; falls back to none when zstandard is not installed
+    min_compress_bytes : encoded values shorter than this are stored uncompressed
+    level : zstd compression level
+    """
+
+    def __init__(self, fmt: str = "json", compression: str = "zstd", min_compress_bytes: int = 256,
+                 level: int = 3):
+        if fmt == "msgpack" and msgpack is None:
+            logger.warning("msgpack is not installed; cache values are encoded as JSON")
+            fmt = "json"
+        if compression == "zstd" and zstandard is None:
+            logger.warning("zstandard is not installed; cache values are stored uncompressed")
+            compression = "none"
+        self.format = FORMAT_MSGPACK if fmt == "msgpack" else FORMAT_JSON
+        self.compress = compression == "zstd"
+        self.min_compress_bytes = min_compress_bytes
+        self.level = level
+
+    def dumps(self, value) -> bytes:
+        if self.format == FORMAT_MSGPACK:
+            body = msgpack.packb(value, use_bin_type=True)
+        else:
+            body = dumps_json(value)
+        header = self.format
+        if self.compress and len(body) >= self.min_compress_bytes:
+            # Compressors are not thread-safe; they are cheap to create
+            body = zstandard.ZstdCompressor(level=self.level).compress(body)
+            header |= FLAG_ZSTD
+        return bytes([header]) + body
+
+    @staticmethod
+    def loads(data: bytes | str):
+        """Decode any supported version, including legacy plain-JSON text entries."""
+        if isinstance(data, str):
+            return json.loads(data)
+        if not data:
+            raise SerializationError("Empty cache value")
+        header, body = data[0], data[1:]
+        if header & ~FLAG_ZSTD not in (FORMAT_JSON, FORMAT_MSGPACK):
+            # Written before versioning: the whole value is JSON text
+            return json.loads(data)
+        try:
+            if header & FLAG_ZSTD:
+                if zstandard is None:
+                    raise SerializationError("zstandard is required to decode this cache value")
+                body = zstandard.ZstdDecompressor().decompress(body)
+            if header & ~FLAG_ZSTD == FORMAT_MSGPACK:
+                if msgpack is None:
+                    raise SerializationError("msgpack is required to decode this cache value")
+                return msgpack.unpackb(body, raw=False)
+            return orjson.loads(body) if orjson is not None else json.loads(body)
+        except SerializationError:
+            raise
+        except Exception as exc:
+            raise SerializationError(str(exc)) from exc
+
+    @classmethod
+    def to_json(cls, data: bytes | str) -> bytes:
+        """JSON text of an encoded value; JSON-format values pass through without being parsed."""
+        if isinstance(data, str):
+            return data.encode("utf-8")
+        if not data:
+            raise SerializationError("Empty cache value")
+        header = data[0]
+        if header & ~FLAG_ZSTD not in (FORMAT_JSON, FORMAT_MSGPACK):
+            # Legacy plain-JSON entry
+            return bytes(data)
+        if header & ~FLAG_ZSTD == FORMAT_JSON:
+            if not header & FLAG_ZSTD:
+                return bytes(data[1:])
+            if zstandard is None:
+                raise SerializationError("zstandard is required to decode this cache value")
+            try:
+                return zstandard.ZstdDecompressor().decompress(data[1:])
+            except Exception as exc:
+                raise SerializationError(str(exc)) from exc
+        return dumps_json(cls.loads(data))
+
+
+def dumps_json(value) -> bytes:
+    """Compact JSON bytes (orjson when installed)."""
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
@@ -0,0 +1,109 @@
+import logging
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import torch
+from transformers import StaticCache
+
+from app.settings import settings
+
+logger = logging.getLogger(__name__)
+
+
+def bucket_for(length: int, buckets: list[int], overflow_step: int = 512) -> int:
+    """Smallest bucket that fits ``length``; beyond the largest bucket, round up to a multiple of ``overflow_step``.
+
+    Rounding long prompts up to a multiple of the largest bucket would pad a 4097-token prompt to 8192.
+    """
+    for bucket in buckets:
+        if length <= bucket:
+            return bucket
+    return -(-length // overflow_step) * overflow_step
+
+
+def pad_to_bucket(inputs, bucket: int, pad_token_id: int):
+    """Left-pad every per-token tensor (ids, mask, token types) to ``bucket``; returns (padded inputs, pad length)."""
+    length = inputs["input_ids"].shape[-1]
+    pad = bucket - length
+    if pad <= 0:
+        return inputs, 0
+    padded = dict(inputs)
+    batch = inputs["input_ids"].shape[0]
+    fills = {"input_ids": pad_token_id, "attention_mask": 0, "token_type_ids": 0}
+    for name, fill in fills.items():
+        if name in inputs:
+            tensor = inputs[name]
+            prefix = torch.full((batch, pad), fill, dtype=tensor.dtype, device=tensor.device)
+            padded[name] = torch.cat([prefix, tensor], dim=-1)
+    return padded, pad
+
+
+def _cache_bytes(cache: StaticCache) -> int:
+    # Layers allocate their KV tensors lazily, on the first update
+    total = 0
+    for layer in getattr(cache, "layers", ()):
+        for tensor in (getattr(layer, "keys", None), getattr(layer, "values", None)):
+            if isinstance(tensor, torch.Tensor):
+                total += tensor.numel() * tensor.element_size()
+    return total
+
+
+class StaticCachePool:
+    """Reusable ``StaticCache`` objects keyed by (model, bucket length + new tokens, batch size).
+
+    A cache is leased for the duration of one ``generate`` call, reset, and returned to the pool, so the KV tensors
+    (and any compiled graph specialised on their shapes) are allocated once per shape instead of once per request.
+    Idle caches are bounded by both the number of shapes and their total size; the least recently used go first.
+    """
+
+    def __init__(self, max_entries: int = 4, max_bytes: int = 0):
+        self._lock = threading.Lock()
+        # LRU: (model id, max_cache_len, batch size) -> list of (idle cache, its size in bytes)
+        self._idle: 'OrderedDict[tuple, list[tuple[StaticCache, int]]]' = OrderedDict()
+        self._max = max_entries
+        self._max_bytes = max_bytes
+        self._bytes = 0
+
+    @contextmanager
+    def lease(self, model, max_cache_len: int, batch_size: int = 1):
+        key = (id(model), max_cache_len, batch_size)
+        cache = None
+        with self._lock:
+            idle = self._idle.get(key)
+            if idle:
+                cache, size = idle.pop()
+                self._bytes -= size
+        if cache is None:
+            logger.info("Allocating static cache (len=%d, batch=%d) for %s", max_cache_len, batch_size,
+                        type(model).__name__)
+            cache = StaticCache(config=model.config, max_cache_len=max_cache_len)
+        else:
+            cache.reset()
+        try:
+            yield cache
+        finally:
+            self._release(key, cache)
+
+    def _release(self, key: tuple, cache: StaticCache):
+        size = _cache_bytes(cache)
+        if self._max_bytes and size > self._max_bytes:
+            # Too large to keep even on its own
+            return
+        with self._lock:
+            self._idle.setdefault(key, []).append((cache, size))
+            self._idle.move_to_end(key)
+            self._bytes += size
+            while len(self._idle) > self._max or (self._max_bytes and self._bytes > self._max_bytes):
+                _, evicted = self._idle.popitem(last=False)
+                self._bytes -= sum(size for _, size in evicted)
+
+    def clear(self, model=None):
+        """Drop pooled caches (all, or only those of ``model``, e.g. when the registry evicts it)."""
+        with self._lock:
+            for key in [k for k in self._idle if model is None or k[0] == id(model)]:
+                self._bytes -= sum(size for _, size in self._idle.pop(key))
+
+
+# Singleton pool shared by all generate calls in this process
+pool = StaticCachePool(max_entries=settings.STATIC_CACHE_POOL_SIZE, max_bytes=settings.STATIC_CACHE_POOL_MAX_BYTES)
@@ -0,0 +1,265 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import weakref
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+import torch
+from transformers.modeling_outputs import BaseModelOutputWithPooling
+
+from app.settings import settings
+
+logger = logging.getLogger(__name__)
+
+
+class VisionFeatureCache:
+    """Byte-bounded LRU of vision-encoder outputs, optionally spilling evicted entries to a memory-mapped disk store.
+
+    Entries are CPU tensors keyed by ``feature_key(image_sha, model_id, processor_fingerprint)``; one entry holds the
+    encoder output for one image (or for a whole tiled batch when images do not map 1:1 to pixel rows).
+    """
+
+    def __init__(self, max_bytes: int, spill_dir: str | None = None, spill_max_bytes: int = 0):
+        self._lock = threading.Lock()
+        # LRU: key -> CPU tensor
+        self._entries: 'OrderedDict[str, torch.Tensor]' = OrderedDict()
+        self._bytes = 0
+        self._max = max_bytes
+        self._spill_dir = spill_dir
+        self._spill_max = spill_max_bytes
+        self._spill_bytes = 0
+        if spill_dir:
+            os.makedirs(spill_dir, exist_ok=True)
+            self._spill_bytes = sum(size for _, size, _ in self._spilled_files())
+
+    @staticmethod
+    def feature_key(image_sha: str, model_id: str, processor_fingerprint: str) -> str:
+        return hashlib.sha256(f"{image_sha}|{model_id}|{processor_fingerprint}".encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> torch.Tensor | None:
+        with self._lock:
+            tensor = self._entries.pop(key, None)
+            if tensor is not None:
+                self._entries[key] = tensor
+                return tensor
+        tensor = self._load_spilled(key)
+        if tensor is not None:
+            # Promote back to memory; the tensor stays backed by the mapped file until evicted again
+            self.put(key, tensor)
+        return tensor
+
+    def put(self, key: str, tensor: torch.Tensor):
+        size = tensor.numel() * tensor.element_size()
+        if size > self._max:
+            return
+        evicted = []
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old.numel() * old.element_size()
+            self._entries[key] = tensor
+            self._bytes += size
+            while self._bytes > self._max:
+                k, t = self._entries.popitem(last=False)
+                self._bytes -= t.numel() * t.element_size()
+                evicted.append((k, t))
+        # Disk IO happens outside the lock
+        for k, t in evicted:
+            self._spill(k, t)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self._spill_dir, f"{key}.pt")
+
+    def _spilled_files(self):
+        for entry in os.scandir(self._spill_dir):
+            if entry.name.endswith(".pt"):
+                stat = entry.stat()
+                yield entry.path, stat.st_size, stat.st_mtime
+
+    def _spill(self, key: str, tensor: torch.Tensor):
+        if not self._spill_dir:
+            return
+        path = self._path(key)
+        if os.path.exists(path):
+            return
+        try:
+            tmp = f"{path}.{os.getpid()}.tmp"
+            torch.save(tensor.contiguous(), tmp)
+            os.replace(tmp, path)
+            self._spill_bytes += os.path.getsize(path)
+        except Exception:
+            logger.warning("Unable to spill vision features to disk: %s", path)
+            return
+        if self._spill_bytes > self._spill_max:
+            self._prune_spilled()
+
+    def _prune_spilled(self):
+        # Oldest-first by mtime (reads touch mtime, so this is LRU)
+        files = sorted(self._spilled_files(), key=lambda f: f[2])
+        total = sum(size for _, size, _ in files)
+        for path, size, _ in files:
+            if total <= self._spill_max * 0.9:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+        self._spill_bytes = total
+
+    def _load_spilled(self, key: str) -> torch.Tensor | None:
+        if not self._spill_dir:
+            return None
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            tensor = torch.load(path, mmap=True, weights_only=True)
+            os.utime(path)
+            return tensor
+        except Exception:
+            logger.warning("Unable to load spilled vision features: %s", path)
+            return None
+
+
+_cache: VisionFeatureCache | None = None
+_cache_lock = threading.Lock()
+# Per-processor config fingerprints (weak so evicted processors are not pinned)
+_fingerprints: 'weakref.WeakKeyDictionary' = weakref.WeakKeyDictionary()
+# Feature keys of the images the current call (thread / task) feeds to the vision tower; None = no caching
+_active_keys: ContextVar[list[str] | None] = ContextVar("vision_cache_keys", default=None)
+
+
+def get_vision_cache() -> VisionFeatureCache | None:
+    """Get or create the process-wide vision feature cache (None when disabled)."""
+    global _cache
+    if not settings.VISION_CACHE_ENABLED:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = VisionFeatureCache(
+                max_bytes=settings.VISION_CACHE_MAX_BYTES,
+                spill_dir=settings.VISION_CACHE_DIR,
+                spill_max_bytes=settings.VISION_CACHE_DISK_MAX_BYTES,
+            )
+        return _cache
+
+
+def processor_fingerprint(processor) -> str:
+    """Short hash of the image-processor config; features are only reusable under identical preprocessing."""
+    try:
+        return _fingerprints[processor]
+    except (KeyError, TypeError):
+        pass
+    image_processor = getattr(processor, "image_processor", processor)
+    try:
+        config = json.dumps(image_processor.to_dict(), sort_keys=True, default=str)
+    except Exception:
+        config = type(image_processor).__name__
+    fingerprint = hashlib.sha256(config.encode("utf-8")).hexdigest()[:16]
+    try:
+        _fingerprints[processor] = fingerprint
+    except TypeError:
+        pass
+    return fingerprint
+
+
+def _model_id(model) -> str:
+    return getattr(model, "name_or_path", None) or type(model).__name__
+
+
+def _vision_entry(model):
+    """Locate the call that runs the vision tower: (owner, attribute, returns_model_output)."""
+    inner = getattr(model, "model", None)
+    if inner is not None and hasattr(inner, "get_image_features"):
+        # Gemma 3 / InternVL: projected image features, called once per prefill
+        return inner, "get_image_features", False
+    vision = getattr(model, "vision_model", None)
+    if vision is not None:
+        # BLIP / BLIP-2: ViT hidden states consumed by the text decoder / Q-Former
+        return vision, "forward", True
+    return None
+
+
+def _cached_call(original, cache: VisionFeatureCache, returns_model_output: bool):
+    def call(*args, **kwargs):
+        keys = _active_keys.get()
+        if keys is None:
+            # Not inside a vision_cache_scope (or no image keys): plain call
+            return original(*args, **kwargs)
+        if "pixel_values" in kwargs:
+            pixel_values = kwargs.pop("pixel_values")
+        else:
+            pixel_values, args = args[0], args[1:]
+
+        def run(pv):
+            return original(pv, *args, **kwargs) if args else original(pixel_values=pv, **kwargs)
+
+        if pixel_values.shape[0] == len(keys):
+            row_keys = keys
+        else:
+            # Tiled inputs (several pixel rows per image): cache the batch as one entry
+            shape = "x".join(str(d) for d in pixel_values.shape)
+            row_keys = [hashlib.sha256(f"{'|'.join(keys)}|{shape}".encode("utf-8")).hexdigest()]
+
+        found = [cache.get(k) for k in row_keys]
+        missing = [i for i, t in enumerate(found) if t is None]
+        output = None
+        if missing:
+            output = run(pixel_values if len(row_keys) == 1 else pixel_values[missing])
+            features = output.last_hidden_state if returns_model_output else output
+            if not torch.is_tensor(features):
+                # Unexpected output layout for this model: skip caching rather than guess
+                return output if len(missing) == len(row_keys) else run(pixel_values)
+            parts = [features] if len(row_keys) == 1 else features.split(1)
+            for i, part in zip(missing, parts):
+                found[i] = part
+                cache.put(row_keys[i], part.detach().to("cpu", copy=True))
+            if len(missing) == len(row_keys):
+                return output
+
+        reference = found[missing[0]] if missing else None
+        device = reference.device if reference is not None else pixel_values.device
+        dtype = reference.dtype if reference is not None else found[0].dtype
+        features = torch.cat([t.to(device=device, dtype=dtype, non_blocking=True) for t in found])
+        return BaseModelOutputWithPooling(last_hidden_state=features) if returns_model_output else features
+
+    call.vision_cache_wrapper = True
+    return call
+
+
+def _install(owner, attr: str, cache: VisionFeatureCache, returns_model_output: bool):
+    """Wrap the vision entry point once per model; concurrent calls pick their keys up from ``_active_keys``."""
+    if getattr(getattr(owner, attr), "vision_cache_wrapper", False):
+        return
+    with _cache_lock:
+        current = getattr(owner, attr)
+        # Re-checked under the lock; also re-wraps if the entry was replaced later (e.g. a compiled forward)
+        if not getattr(current, "vision_cache_wrapper", False):
+            setattr(owner, attr, _cached_call(current, cache, returns_model_output))
+
+
+@contextmanager
+def vision_cache_scope(model, processor, image_keys: list[str] | None):
+    """Serve vision-encoder outputs from the cache while the block runs, so only the language side executes on a hit.
+
+    ``image_keys`` are the sha256 hashes of the images in the order they reach the model. The model's vision entry
+    point is wrapped once; the keys travel in a context variable, so concurrent calls on one model do not serialize.
+    """
+    cache = get_vision_cache()
+    entry = _vision_entry(model) if cache is not None and image_keys else None
+    if entry is None:
+        yield
+        return
+    owner, attr, returns_model_output = entry
+    model_id, fingerprint = _model_id(model), processor_fingerprint(processor)
+    _install(owner, attr, cache, returns_model_output)
+    token = _active_keys.set([cache.feature_key(sha, model_id, fingerprint) for sha in image_keys])
+    try:
+        yield
+    finally:
+        _active_keys.reset(token)
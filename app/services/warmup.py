@@ -0,0 +1,35 @@
+import logging
+import time
+
+from app.inference.generation import generate, model_family
+from app.services.model_registry import registry
+from app.settings import settings
+
+logger = logging.getLogger(__name__)
+
+
+def warm_up(key: str):
+    """Load a model and, when static-cache compilation is on, run one decode per bucket and generation length.
+
+    Each (bucket, max_new_tokens) pair is a distinct static-cache shape and therefore a distinct compiled graph;
+    paying for them here keeps the first real requests from absorbing compilation latency.
+    """
+    processor, model, device = registry.get(key)
+    if not settings.STATIC_CACHE_COMPILE:
+        return
+    tokenizer = getattr(processor, "tokenizer", processor)
+    lengths = sorted({
+        preset["max_new_tokens"]
+        for preset in settings.GENERATION_PRESETS.get(model_family(model), {}).values()
+        if preset.get("cache_implementation") == "static" and preset.get("max_new_tokens")
+    })
+    for bucket in settings.STATIC_CACHE_BUCKETS:
+        # A prompt exactly one bucket long, so padding is a no-op and the bucket's cache shape is hit
+        inputs = tokenizer("warm up " * bucket, truncation=True, max_length=bucket, return_tensors="pt").to(model.device)
+        for max_new_tokens in lengths:
+            start_time = time.time()
+            # min_new_tokens pins the decode length so every step of the graph is exercised
+            generate(model, inputs, processor, max_new_tokens=max_new_tokens, min_new_tokens=max_new_tokens,
+                     cache_implementation="static", disable_compile=False)
+            logger.info("Warmed %s bucket=%d max_new_tokens=%d in %.1fs", key, bucket, max_new_tokens,
+                        time.time() - start_time)
@@ -1,8 +1,11 @@
+import json
 import os, logging
 
 from dotenv import load_dotenv, find_dotenv
 from pydantic import BaseModel, Field
 
+from app.presets import merge_presets
+
 # Load .env from current directory or nearest parent automatically
 # This makes uvicorn runs work regardless of --env-file usage or CWD
 load_dotenv(find_dotenv(), override=False)
@@ -31,6 +34,77 @@ class Settings(BaseModel):
     # Cache TTL (seconds)
     CACHE_TTL_SECONDS: int = int(os.getenv("CACHE_TTL_SECONDS", 24 * 3600))
 
+    # Cache value encoding: msgpack | json (orjson when installed); zstd | none for values >= the size threshold
+    CACHE_SERIALIZER: str = os.getenv("CACHE_SERIALIZER", "json")
+    CACHE_COMPRESSION: str = os.getenv("CACHE_COMPRESSION", "zstd")
+    CACHE_COMPRESSION_MIN_BYTES: int = int(os.getenv("CACHE_COMPRESSION_MIN_BYTES", 256))
+    # Persistent local disk tier (SQLite) behind Redis; unset disables it
+    CACHE_DISK_PATH: str | None = os.getenv("CACHE_DISK_PATH") or None
+    CACHE_DISK_MAX_BYTES: int = int(os.getenv("CACHE_DISK_MAX_BYTES", 1024 * 1024 * 1024))  # 1 GB
+
+    # Collective captioning: describe already-seen images by their cached short caption instead of re-encoding them
+    COLLECTIVE_REUSE_CAPTIONS: bool = os.getenv("COLLECTIVE_REUSE_CAPTIONS", "false").lower() == "true"
+
+    # Vision-encoder feature cache (in-memory LRU, optional memory-mapped disk spill)
+    VISION_CACHE_ENABLED: bool = os.getenv("VISION_CACHE_ENABLED", "true").lower() == "true"
+    VISION_CACHE_MAX_BYTES: int = int(os.getenv("VISION_CACHE_MAX_BYTES", 512 * 1024 * 1024))  # 512 MB
+    VISION_CACHE_DIR: str | None = os.getenv("VISION_CACHE_DIR") or None
+    VISION_CACHE_DISK_MAX_BYTES: int = int(os.getenv("VISION_CACHE_DISK_MAX_BYTES", 4 * 1024 * 1024 * 1024))  # 4 GB
+
+    # Tensor-based ("fast") image processors for all models; false restores the PIL / NumPy processors
+    FAST_IMAGE_PROCESSORS: bool = os.getenv("FAST_IMAGE_PROCESSORS", "true").lower() == "true"
+
+    # Generation presets per model and task; GENERATION_PRESETS is a JSON overlay, e.g.
+    # {"gemma": {"caption": {"num_beams": 3}, "flag": {"mode": "generate"}}}
+    GENERATION_PRESETS: dict = merge_presets(json.loads(os.getenv("GENERATION_PRESETS") or "{}"))
+
+    # Static KV-cache shape bucketing: prompts are left-padded to the next bucket and reuse pooled caches
+    STATIC_CACHE_BUCKETS: list[int] = sorted(
+        int(b) for b in os.getenv("STATIC_CACHE_BUCKETS", "256,512,1024,2048,4096").split(",") if b.strip()
+    )
+    STATIC_CACHE_POOL_SIZE: int = int(os.getenv("STATIC_CACHE_POOL_SIZE", 4))  # distinct cache shapes kept
+    # Total size of idle pooled caches (0 = shape count only)
+    STATIC_CACHE_POOL_MAX_BYTES: int = int(os.getenv("STATIC_CACHE_POOL_MAX_BYTES", 2 * 1024 ** 3))
+    # Let transformers compile static-cache decoding (warmed per bucket at startup for WARMUP_MODELS)
+    STATIC_CACHE_COMPILE: bool = os.getenv("STATIC_CACHE_COMPILE", "false").lower() == "true"
+
+    # Optimized execution mode per model (comma-separated keys or "all"): inference_mode, SDPA, torch.compile
+    OPTIMIZED_MODELS: list[str] = [m.strip() for m in os.getenv("OPTIMIZED_MODELS", "").split(",") if m.strip()]
+    OPTIMIZE_COMPILE: bool = os.getenv("OPTIMIZE_COMPILE", "true").lower() == "true"
+    # CPU thread tuning (0 keeps the torch default)
+    TORCH_NUM_THREADS: int = int(os.getenv("TORCH_NUM_THREADS", 0))
+    TORCH_NUM_INTEROP_THREADS: int = int(os.getenv("TORCH_NUM_INTEROP_THREADS", 0))
+
+    # Models loaded (and warmed up) when a worker starts, comma-separated registry keys
+    WARMUP_MODELS: list[str] = [m.strip() for m in os.getenv("WARMUP_MODELS", "").split(",") if m.strip()]
+
+    # Dedicated model server: HTTP workers keep processors only and forward tensors over a local socket
+    MODEL_SERVER_ENABLED: bool = os.getenv("MODEL_SERVER_ENABLED", "false").lower() == "true"
+    MODEL_SERVER_ADDRESS: str = os.getenv("MODEL_SERVER_ADDRESS", "/tmp/vlm-model-server.sock")
+    # Empty: gunicorn_conf generates a random key per run and hands it to the server and workers
+    MODEL_SERVER_AUTHKEY: str = os.getenv("MODEL_SERVER_AUTHKEY", "")
+    MODEL_SERVER_CONNECT_TIMEOUT: int = int(os.getenv("MODEL_SERVER_CONNECT_TIMEOUT", 600))  # seconds
+    # Compatible queued requests (same model, op, settings and input shapes) merged into one model call
+    MODEL_SERVER_MAX_BATCH: int = int(os.getenv("MODEL_SERVER_MAX_BATCH", 8))
+
+    # Admission control: per-model concurrent generations and outstanding estimated seconds of work
+    ADMISSION_MAX_CONCURRENCY: int = int(os.getenv("ADMISSION_MAX_CONCURRENCY", 1))
+    ADMISSION_COST_BUDGET_SECONDS: float = float(os.getenv("ADMISSION_COST_BUDGET_SECONDS", 120))
+    # JSON overlay of the cost model, e.g. {"gemma": {"per_image": 1.5, "per_token": 0.08}}
+    ADMISSION_COSTS: dict = json.loads(os.getenv("ADMISSION_COSTS") or "{}")
+
+    # Cascade routing (model=auto): caption with the cheap model, escalate below the confidence threshold
+    CASCADE_FIRST_MODEL: str = os.getenv("CASCADE_FIRST_MODEL", "blip")
+    CASCADE_ESCALATION_MODEL: str = os.getenv("CASCADE_ESCALATION_MODEL", "intern_vlm")
+    CASCADE_MIN_CONFIDENCE: float = float(os.getenv("CASCADE_MIN_CONFIDENCE", 0.5))
+
+    # Assisted (speculative) decoding for greedy generation (comma-separated keys or "all"), draft model and lookahead
+    ASSISTED_DECODING_MODELS: list[str] = [
+        m.strip() for m in os.getenv("ASSISTED_DECODING_MODELS", "").split(",") if m.strip()
+    ]
+    ASSISTANT_MODEL_ID: str = os.getenv("ASSISTANT_MODEL_ID", "google/gemma-3-1b-it")
+    ASSISTED_NUM_TOKENS: int = int(os.getenv("ASSISTED_NUM_TOKENS", 5))
+
 
 settings = Settings()
 
@@ -0,0 +1,54 @@
+import time
+import unittest
+
+from app.services.admission import AdmissionController, AdmissionRejected, RequestCancelled
+
+
+class TestAdmissionController(unittest.TestCase):
+    def setUp(self):
+        self.controller = AdmissionController(
+            max_concurrency=1, cost_budget=10.0, cost_model={"blip": {"per_image": 1.0, "per_token": 0.0},
+                                                             "gemma": {"per_image": 4.0, "per_token": 0.0}}
+        )
+
+    def test_rejects_over_budget(self):
+        self.controller.admit("blip", 6, 0)
+        with self.assertRaises(AdmissionRejected) as ctx:
+            self.controller.admit("blip", 6, 0)
+        self.assertIsNotNone(ctx.exception.retry_after)
+
+    def test_releases_cost_after_run(self):
+        ticket = self.controller.admit("blip", 6, 0)
+        self.assertEqual(self.controller.run(ticket, lambda: "ok"), "ok")
+        self.controller.admit("blip", 6, 0)
+
+    def test_rejects_infeasible_deadline(self):
+        with self.assertRaises(AdmissionRejected):
+            self.controller.admit("blip", 2, 0, deadline_ms=500)
+
+    def test_cancelled_ticket_does_not_run(self):
+        ticket = self.controller.admit("blip", 1, 0)
+        ticket.cancelled.set()
+        with self.assertRaises(RequestCancelled):
+            self.controller.run(ticket, lambda: "ok")
+
+    def test_expired_deadline(self):
+        ticket = self.controller.admit("blip", 1, 0, deadline_ms=5000)
+        ticket.deadline = time.monotonic() - 1
+        self.assertTrue(ticket.expired())
+
+    def test_nested_slot_charges_other_model(self):
+        def escalate():
+            with self.controller.slot("gemma", images=2):
+                # Two escalated images (8s) are outstanding on gemma: another 2-image request does not fit
+                with self.assertRaises(AdmissionRejected):
+                    self.controller.admit("gemma", 2, 0)
+            return "ok"
+
+        ticket = self.controller.admit("blip", 2, 0)
+        self.assertEqual(self.controller.run(ticket, escalate), "ok")
+        self.controller.admit("gemma", 2, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,65 @@
+import os
+import sqlite3
+import tempfile
+import time
+import unittest
+
+from app.services.disk_cache import DiskCache
+from app.services.serialization import Serializer
+
+
+class TestSerializer(unittest.TestCase):
+    def setUp(self):
+        self.value = {"caption": "a dog on a beach", "tags": ["dog", "beach"] * 25, "flagged": False}
+
+    def test_round_trip(self):
+        for fmt in ("msgpack", "json"):
+            for compression in ("zstd", "none"):
+                serializer = Serializer(fmt=fmt, compression=compression, min_compress_bytes=0)
+                self.assertEqual(serializer.loads(serializer.dumps(self.value)), self.value)
+
+    def test_decodes_legacy_json(self):
+        self.assertEqual(Serializer.loads(b'{"caption": "a dog"}'), {"caption": "a dog"})
+        self.assertEqual(Serializer.loads('{"caption": "a dog"}'), {"caption": "a dog"})
+
+    def test_rejects_corrupt_value(self):
+        with self.assertRaises(ValueError):
+            Serializer.loads(b"\x02\xc1garbage")
+
+
+class TestDiskCache(unittest.TestCase):
+    def setUp(self):
+        self.path = os.path.join(tempfile.mkdtemp(), "cache.db")
+        self.disk = DiskCache(self.path, max_bytes=2000, prune_every=5)
+
+    def test_get_set(self):
+        self.disk.set("a", b"value", ttl=60)
+        self.assertEqual(self.disk.get_many(["a", "b"]), [b"value", None])
+
+    def test_expired(self):
+        self.disk.set("a", b"value", ttl=-1)
+        self.assertIsNone(self.disk.get("a"))
+
+    def test_prunes_least_recently_used(self):
+        for i in range(50):
+            self.disk.set(f"k{i}", b"x" * 100, ttl=60)
+            time.sleep(0.001)
+        self.assertIsNotNone(self.disk.get("k49"))
+        self.assertIsNone(self.disk.get("k0"))
+
+    def test_read_while_another_writer_holds_the_lock(self):
+        self.disk.set("a", b"value", ttl=60)
+        writer = sqlite3.connect(self.path, isolation_level=None)
+        writer.execute("BEGIN IMMEDIATE")
+        try:
+            start = time.monotonic()
+            self.assertEqual(self.disk.get_many(["a"]), [b"value"])
+            # The access-time update is skipped instead of waiting out the busy timeout
+            self.assertLess(time.monotonic() - start, 1.0)
+        finally:
+            writer.execute("ROLLBACK")
+            writer.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,79 @@
+import sys
+import types
+import unittest
+from unittest import mock
+
+from app.routers.caption import _collective_flag
+from app.schemas import CaptionQuery
+from app.services.cache import Cache
+from app.services.serialization import Serializer
+
+
+class FakeRedis:
+    """The subset of the redis client used by Cache."""
+
+    def __init__(self):
+        self.data = {}
+
+    def mget(self, keys):
+        return [self.data.get(key) for key in keys]
+
+    def set(self, key, value, ex=None):
+        self.data[key] = value
+
+
+class TestCollectiveFlag(unittest.TestCase):
+    def setUp(self):
+        self.cache = Cache(FakeRedis(), serializer=Serializer(fmt="json", compression="none"))
+        # Redis only, whatever CACHE_DISK_PATH says
+        self.cache.disk = None
+        self.query = CaptionQuery(model="gemma")
+        self.hashes = ["h0", "h1", "h2"]
+        self.images = ["img0", "img1", "img2"]
+        self.scored = []
+
+    def _flag_key(self, sha: str) -> str:
+        return self.cache.artifact_key("flag", sha, "gemma", self.query.flag_caption_prompt)
+
+    def _run(self, verdict: bool) -> bool:
+        def is_flagged(processor, model, device, images, prompt, image_keys=None):
+            self.scored.append(list(image_keys))
+            return verdict
+
+        flagging = types.ModuleType("app.inference.flagging")
+        flagging.is_flagged = is_flagged
+        # Stub the model-backed module so the test needs neither torch nor a model
+        with mock.patch.dict(sys.modules, {"app.inference.flagging": flagging}):
+            return _collective_flag(self.cache, None, None, "cpu", "gemma", self.query, self.hashes, self.images)
+
+    def test_cached_positive_short_circuits(self):
+        self.cache.set_json(self._flag_key("h1"), {"flagged": True})
+        self.assertTrue(self._run(False))
+        self.assertEqual(self.scored, [])
+
+    def test_scores_only_unseen_images(self):
+        self.cache.set_json(self._flag_key("h0"), {"flagged": False})
+        self.assertFalse(self._run(False))
+        self.assertEqual(self.scored, [["h1", "h2"]])
+
+    def test_negative_is_cached_for_every_image(self):
+        self.assertFalse(self._run(False))
+        self.assertEqual([self.cache.get_json(self._flag_key(h)) for h in self.hashes], [{"flagged": False}] * 3)
+        # A second pass is answered from the cache
+        self.assertFalse(self._run(True))
+        self.assertEqual(len(self.scored), 1)
+
+    def test_multi_image_positive_caches_nothing(self):
+        self.assertTrue(self._run(True))
+        self.assertEqual([self.cache.get_json(self._flag_key(h)) for h in self.hashes], [None] * 3)
+
+    def test_single_image_positive_is_cached(self):
+        self.cache.set_json(self._flag_key("h0"), {"flagged": False})
+        self.cache.set_json(self._flag_key("h1"), {"flagged": False})
+        self.assertTrue(self._run(True))
+        self.assertEqual(self.scored, [["h2"]])
+        self.assertEqual(self.cache.get_json(self._flag_key("h2")), {"flagged": True})
+
+
+if __name__ == "__main__":
+    unittest.main()
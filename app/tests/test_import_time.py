@@ -0,0 +1,30 @@
+import json
+import os
+import subprocess
+import sys
+import unittest
+
+# Heavy libraries that must only load on the first model / tagging call
+HEAVY_MODULES = ["torch", "transformers", "torchvision", "spacy", "nltk"]
+
+_PROBE = f"""
+import json, sys, time
+start = time.perf_counter()
+import app.main
+elapsed = time.perf_counter() - start
+print(json.dumps({{"seconds": elapsed, "loaded": [m for m in {HEAVY_MODULES!r} if m in sys.modules]}}))
+"""
+
+
+class TestImportTime(unittest.TestCase):
+    def test_app_imports_without_model_libraries(self):
+        # Fresh interpreter: nothing imported by other tests can hide a regression
+        root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        out = subprocess.run([sys.executable, "-c", _PROBE], cwd=root, capture_output=True, text=True, check=True)
+        result = json.loads(out.stdout.strip().splitlines()[-1])
+        self.assertEqual(result["loaded"], [])
+        self.assertLess(result["seconds"], 1.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
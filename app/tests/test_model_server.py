@@ -0,0 +1,45 @@
+import unittest
+
+import torch
+
+from app.services.admission import Ticket
+from app.services.model_server import _BatchTicket, _Job, _compatible, _merge, _split
+
+
+def _job(rows: int, fill: float, op: str = "generate", **kwargs) -> _Job:
+    return _Job({"op": op, "model": "blip", "inputs": {"pixel_values": torch.full((rows, 3, 4, 4), fill)},
+                 "image_keys": [f"img{fill}-{i}" for i in range(rows)], "kwargs": kwargs, "deadline": None})
+
+
+class TestRequestBatching(unittest.TestCase):
+    def test_compatible(self):
+        first = _job(1, 0.0, max_new_tokens=10)
+        self.assertTrue(_compatible(first, _job(2, 1.0, max_new_tokens=10)))
+        self.assertFalse(_compatible(first, _job(1, 1.0, max_new_tokens=20)))
+        self.assertFalse(_compatible(first, _job(1, 1.0, op="forward_logits", max_new_tokens=10)))
+        other_shape = _Job({**first.request, "inputs": {"pixel_values": torch.zeros(1, 3, 8, 8)}})
+        self.assertFalse(_compatible(first, other_shape))
+
+    def test_merge_and_split(self):
+        jobs = [_job(1, 0.0), _job(2, 1.0)]
+        merged = _merge(jobs)
+        self.assertEqual(merged["inputs"]["pixel_values"].shape[0], 3)
+        self.assertEqual(merged["image_keys"], ["img0.0-0", "img1.0-0", "img1.0-1"])
+        sequences = torch.arange(6).reshape(3, 2)
+        parts = _split("generate_scored", (sequences, [0.1, 0.2, 0.3]), jobs)
+        self.assertEqual(parts[0][0].tolist(), [[0, 1]])
+        self.assertEqual(parts[0][1], [0.1])
+        self.assertEqual(parts[1][0].tolist(), [[2, 3], [4, 5]])
+        self.assertEqual(parts[1][1], [0.2, 0.3])
+
+    def test_batch_ticket_expires_with_last_member(self):
+        members = [Ticket(model="blip", cost=0.0), Ticket(model="blip", cost=0.0)]
+        batch = _BatchTicket(members)
+        members[0].cancelled.set()
+        self.assertFalse(batch.expired())
+        members[1].cancelled.set()
+        self.assertTrue(batch.expired())
+
+
+if __name__ == "__main__":
+    unittest.main()
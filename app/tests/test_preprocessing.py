@@ -0,0 +1,86 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import torch
+from PIL import Image
+from transformers import BertTokenizer, BlipConfig, BlipForConditionalGeneration, BlipImageProcessor, BlipProcessor
+
+from app.inference.captioning import _blip_inputs, infer_image_captions
+from app.inference.preprocessing import preprocess_images, supports_batched_preprocessing
+
+
+class TestBatchedPreprocessing(unittest.TestCase):
+    def setUp(self):
+        # Slow (PIL / NumPy) BLIP image processor with the captioning checkpoint's defaults
+        self.image_processor = BlipImageProcessor()
+        rng = np.random.default_rng(0)
+        # Mixed sizes (down- and up-scaling, two of the same size) with smooth content plus noise
+        self.images = []
+        for width, height in [(640, 480), (640, 480), (300, 500), (200, 150)]:
+            gradient = np.linspace(0, 255, width)[None, :, None] * np.ones((height, 1, 3))
+            noise = rng.normal(0, 20, (height, width, 3))
+            self.images.append(Image.fromarray(np.clip(gradient + noise, 0, 255).astype(np.uint8), "RGB"))
+
+    def test_supported(self):
+        self.assertTrue(supports_batched_preprocessing(self.image_processor))
+
+    def test_matches_slow_processor(self):
+        expected = self.image_processor(self.images, return_tensors="pt")["pixel_values"]
+        actual = preprocess_images(self.image_processor, self.images)
+        self.assertEqual(actual.shape, expected.shape)
+        self.assertTrue(actual.is_contiguous())
+        # Resampling differs by a few intensity levels at most (one level is ~0.015 after normalization)
+        diff = (actual - expected).abs()
+        self.assertLess(diff.mean().item(), 0.02)
+        self.assertLess(diff.max().item(), 0.2)
+
+    def test_dtype(self):
+        actual = preprocess_images(self.image_processor, self.images[:1], dtype=torch.bfloat16)
+        self.assertEqual(actual.dtype, torch.bfloat16)
+
+
+class TestBatchedBlipCaptioning(unittest.TestCase):
+    """Prompted captioning through the batched path, on a tiny randomly initialised BLIP (no download)."""
+
+    @classmethod
+    def setUpClass(cls):
+        vocab = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]", "[DEC]", "a", "photo", "of", "dog", "beach"]
+        with tempfile.TemporaryDirectory() as tmp:
+            vocab_file = os.path.join(tmp, "vocab.txt")
+            with open(vocab_file, "w") as f:
+                f.write("\n".join(vocab))
+            tokenizer = BertTokenizer(vocab_file)
+        image_processor = BlipImageProcessor(size={"height": 32, "width": 32})
+        cls.processor = BlipProcessor(image_processor=image_processor, tokenizer=tokenizer)
+        torch.manual_seed(0)
+        config = BlipConfig(
+            vision_config={"hidden_size": 32, "intermediate_size": 37, "num_hidden_layers": 1,
+                           "num_attention_heads": 2, "image_size": 32, "patch_size": 16},
+            text_config={"vocab_size": len(vocab), "hidden_size": 32, "intermediate_size": 37,
+                         "num_hidden_layers": 1, "num_attention_heads": 2, "bos_token_id": 5,
+                         "sep_token_id": 3, "pad_token_id": 0},
+        )
+        cls.model = BlipForConditionalGeneration(config).eval()
+        cls.images = [Image.new("RGB", (64, 48), (200, 100, 50)), Image.new("RGB", (40, 40), (10, 20, 30))]
+
+    def test_prompted_inputs_have_no_token_type_ids(self):
+        self.assertTrue(supports_batched_preprocessing(self.processor))
+        inputs = _blip_inputs(self.processor, self.model, "cpu", self.images, "a photo of")
+        self.assertNotIn("token_type_ids", inputs)
+        self.assertEqual(inputs["input_ids"].shape[0], len(self.images))
+
+    def test_prompted_captions(self):
+        captions = infer_image_captions(self.processor, self.model, "cpu", self.images, "a photo of",
+                                        max_new_tokens=4)
+        self.assertEqual(len(captions), len(self.images))
+        self.assertTrue(all(isinstance(caption, str) for caption in captions))
+
+    def test_unprompted_captions(self):
+        captions = infer_image_captions(self.processor, self.model, "cpu", self.images, max_new_tokens=4)
+        self.assertEqual(len(captions), len(self.images))
+
+
+if __name__ == "__main__":
+    unittest.main()
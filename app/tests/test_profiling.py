@@ -0,0 +1,67 @@
+import io
+import threading
+import time
+import unittest
+import zipfile
+
+from app.services.profiling import capture_profile, ProfilerBusy
+
+
+class TestProfileCapture(unittest.TestCase):
+    def setUp(self):
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._busy, name="busy-worker", daemon=True)
+        self._thread.start()
+
+    def tearDown(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _busy(self):
+        while not self._stop.is_set():
+            sum(i * i for i in range(1000))
+
+    def test_capture_contains_sampled_stacks(self):
+        archive = zipfile.ZipFile(io.BytesIO(capture_profile(0.5, torch_ops=False, memory=True)))
+        self.assertIn("tracemalloc.txt", archive.namelist())
+        stacks = archive.read("stacks.collapsed").decode()
+        self.assertIn("busy-worker;", stacks)
+        self.assertIn("_busy (", stacks)
+
+    def test_torch_ops_include_other_threads(self):
+        try:
+            import torch
+        except ImportError:
+            self.skipTest("torch is not installed")
+        stop = threading.Event()
+
+        def matmul():
+            a = torch.ones(64, 64)
+            while not stop.is_set():
+                torch.mm(a, a)
+
+        worker = threading.Thread(target=matmul, name="torch-worker", daemon=True)
+        worker.start()
+        try:
+            archive = zipfile.ZipFile(io.BytesIO(capture_profile(0.5)))
+        finally:
+            stop.set()
+            worker.join()
+        self.assertIn("aten::mm", archive.read("torch_ops.txt").decode())
+
+    def test_rejects_concurrent_capture(self):
+        errors = []
+        first = threading.Thread(target=capture_profile, args=(0.5,), kwargs={"memory": False, "torch_ops": False})
+        first.start()
+        # Let the first capture take the lock
+        time.sleep(0.1)
+        try:
+            capture_profile(0.1, memory=False, torch_ops=False)
+        except ProfilerBusy as exc:
+            errors.append(exc)
+        first.join()
+        self.assertEqual(len(errors), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
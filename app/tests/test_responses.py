@@ -0,0 +1,37 @@
+import json
+import unittest
+
+from app.responses import cached_item_json, results_json
+from app.schemas import CaptionItem, CaptionResponse
+from app.services.serialization import Serializer
+
+
+class TestCachedItemJson(unittest.TestCase):
+    def setUp(self):
+        self.item = {"caption": "a dog on a beach", "tags": ["dog", "beach"], "flagged": False, "model": "blip"}
+
+    def _expected(self, filename: str) -> dict:
+        # What the validated (non-cached) path returns for the same item
+        return CaptionResponse(results=[CaptionItem(filename=filename, **self.item, cache=True)]).model_dump()
+
+    def test_matches_validated_response(self):
+        for filename in ("photo.png", 'a "quoted" \\ näme ✓.jpg'):
+            for fmt in ("json", "msgpack"):
+                for compression in ("none", "zstd"):
+                    # Stored the way Cache.set_json stores it, read back the way hits are served
+                    serializer = Serializer(fmt=fmt, compression=compression, min_compress_bytes=0)
+                    raw = Serializer.to_json(serializer.dumps(self.item))
+                    spliced = cached_item_json(filename, raw)
+                    self.assertEqual(json.loads(results_json([spliced])), self._expected(filename))
+
+    def test_tolerates_whitespace(self):
+        spliced = cached_item_json("x.png", b'  { "caption": "a cat" }\n')
+        self.assertEqual(json.loads(spliced), {"filename": "x.png", "cache": True, "caption": "a cat"})
+
+    def test_rejects_empty_and_non_objects(self):
+        for raw in (b"{}", b"{ }", b"[1, 2]", b'"caption"', b"null", b"", b"  "):
+            self.assertIsNone(cached_item_json("x.png", raw), raw)
+
+
+if __name__ == "__main__":
+    unittest.main()
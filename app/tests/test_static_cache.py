@@ -0,0 +1,127 @@
+import types
+import unittest
+from unittest import mock
+
+import torch
+from transformers import LlamaConfig, LlamaForCausalLM
+
+from app.inference.generation import _generate_bucketed
+from app.services import static_cache
+from app.services.static_cache import StaticCachePool, bucket_for, pad_to_bucket
+
+
+class TestBuckets(unittest.TestCase):
+    def test_bucket_for(self):
+        buckets = [256, 512, 1024, 2048, 4096]
+        self.assertEqual(bucket_for(1, buckets), 256)
+        self.assertEqual(bucket_for(256, buckets), 256)
+        self.assertEqual(bucket_for(257, buckets), 512)
+        self.assertEqual(bucket_for(4096, buckets), 4096)
+
+    def test_bucket_for_overflow(self):
+        # Past the largest bucket lengths round up in fine steps, not to a multiple of the largest bucket
+        self.assertEqual(bucket_for(4097, [256, 4096]), 4608)
+        self.assertEqual(bucket_for(5000, [256, 4096], overflow_step=256), 5120)
+
+    def test_pad_to_bucket(self):
+        inputs = {"input_ids": torch.tensor([[5, 6, 7]]), "attention_mask": torch.ones(1, 3, dtype=torch.long),
+                  "token_type_ids": torch.ones(1, 3, dtype=torch.long), "pixel_values": torch.zeros(1, 3, 2, 2)}
+        padded, pad = pad_to_bucket(inputs, 5, pad_token_id=0)
+        self.assertEqual(pad, 2)
+        self.assertEqual(padded["input_ids"].tolist(), [[0, 0, 5, 6, 7]])
+        self.assertEqual(padded["attention_mask"].tolist(), [[0, 0, 1, 1, 1]])
+        self.assertEqual(padded["token_type_ids"].tolist(), [[0, 0, 1, 1, 1]])
+        self.assertIs(padded["pixel_values"], inputs["pixel_values"])
+
+    def test_pad_to_bucket_noop(self):
+        inputs = {"input_ids": torch.tensor([[5, 6, 7]])}
+        for bucket in (3, 2):
+            padded, pad = pad_to_bucket(inputs, bucket, pad_token_id=0)
+            self.assertIs(padded, inputs)
+            self.assertEqual(pad, 0)
+
+
+class FakeStaticCache:
+    """KV tensors of ``max_cache_len`` bytes, like a lazily initialised StaticCache after its first decode."""
+
+    def __init__(self, config=None, max_cache_len: int = 0):
+        self.layers = [types.SimpleNamespace(keys=torch.zeros(max_cache_len // 2, dtype=torch.uint8),
+                                             values=torch.zeros(max_cache_len // 2, dtype=torch.uint8))]
+        self.resets = 0
+
+    def reset(self):
+        self.resets += 1
+
+
+class TestStaticCachePool(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch.object(static_cache, "StaticCache", FakeStaticCache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.model = types.SimpleNamespace(config=None)
+
+    def _use(self, pool: StaticCachePool, length: int) -> FakeStaticCache:
+        with pool.lease(self.model, length) as cache:
+            return cache
+
+    def test_reuses_and_resets(self):
+        pool = StaticCachePool(max_entries=2)
+        first = self._use(pool, 100)
+        self.assertIs(self._use(pool, 100), first)
+        self.assertEqual(first.resets, 1)
+
+    def test_evicts_least_recently_used_shape(self):
+        pool = StaticCachePool(max_entries=2)
+        a, b = self._use(pool, 100), self._use(pool, 200)
+        self._use(pool, 100)
+        self._use(pool, 300)
+        self.assertIs(self._use(pool, 100), a)
+        self.assertIsNot(self._use(pool, 200), b)
+
+    def test_byte_cap(self):
+        pool = StaticCachePool(max_entries=10, max_bytes=500)
+        a = self._use(pool, 200)
+        self._use(pool, 300)
+        # 200 + 300 fits; adding 250 goes over the cap and pushes out the oldest shapes
+        self._use(pool, 250)
+        self.assertIsNot(self._use(pool, 200), a)
+        self.assertLessEqual(pool._bytes, 500)
+        # Larger than the cap on its own: never pooled
+        big = self._use(pool, 600)
+        self.assertIsNot(self._use(pool, 600), big)
+
+    def test_clear(self):
+        pool = StaticCachePool(max_entries=2, max_bytes=1000)
+        self._use(pool, 100)
+        pool.clear(self.model)
+        self.assertEqual(pool._bytes, 0)
+
+
+class TestBucketedGeneration(unittest.TestCase):
+    """Left-padding into a pooled static cache decodes the same tokens as plain greedy decoding."""
+
+    @classmethod
+    def setUpClass(cls):
+        torch.manual_seed(0)
+        config = LlamaConfig(vocab_size=64, hidden_size=32, intermediate_size=64, num_hidden_layers=2,
+                             num_attention_heads=4, num_key_value_heads=2, max_position_embeddings=256,
+                             pad_token_id=0, bos_token_id=1, eos_token_id=2)
+        cls.model = LlamaForCausalLM(config).eval()
+        cls.tokenizer = types.SimpleNamespace(pad_token_id=0)
+
+    def test_matches_greedy(self):
+        pool = StaticCachePool(max_entries=4)
+        with mock.patch.object(static_cache, "pool", pool), \
+                mock.patch.object(static_cache.settings, "STATIC_CACHE_BUCKETS", [64, 128]):
+            # The repeated length decodes into the cache pooled by the first call
+            for length in (10, 10, 40):
+                input_ids = torch.randint(3, 64, (1, length))
+                inputs = {"input_ids": input_ids, "attention_mask": torch.ones_like(input_ids)}
+                kwargs = {"max_new_tokens": 8, "do_sample": False, "cache_implementation": "static"}
+                expected = self.model.generate(**inputs, max_new_tokens=8, do_sample=False)
+                actual = _generate_bucketed(self.model, inputs, self.tokenizer, dict(kwargs))
+                self.assertEqual(actual.tolist(), expected.tolist())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,65 @@
+"""Microbenchmark: per-item cost of building a /api/caption-images response from cache hits.
+
+Compares the previous path (decode each cached item, rebuild the dict, validate through ``CaptionResponse`` and
+encode with the stdlib JSON encoder, as FastAPI does for ``response_model`` routes) with the raw passthrough
+(splice the stored JSON bytes into the body).
+
+Usage: python -m scripts.bench_responses [--items 100] [--repeat 200]
+"""
+import argparse
+import json
+import time
+
+from fastapi.encoders import jsonable_encoder
+
+from app.responses import cached_item_json, results_json
+from app.schemas import CaptionResponse
+from app.services.serialization import Serializer
+
+
+def _cached_values(serializer: Serializer, items: int) -> list[bytes]:
+    value = {
+        "caption": "a woman sitting on the beach with her dog at sunset",
+        "tags": [f"tag{i}" for i in range(50)],
+        "flagged": False,
+        "model": "blip",
+    }
+    return [serializer.dumps(value) for _ in range(items)]
+
+
+def validated_path(serializer: Serializer, values: list[bytes]) -> bytes:
+    results = [{"filename": f"img{i}.jpg", **serializer.loads(v), "cache": True} for i, v in enumerate(values)]
+    response = CaptionResponse.model_validate({"results": results})
+    return json.dumps(jsonable_encoder(response), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def passthrough_path(serializer: Serializer, values: list[bytes]) -> bytes:
+    return results_json([cached_item_json(f"img{i}.jpg", serializer.to_json(v)) for i, v in enumerate(values)])
+
+
+def _per_item_us(fn, serializer: Serializer, values: list[bytes], repeat: int) -> float:
+    fn(serializer, values)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn(serializer, values)
+    return (time.perf_counter() - start) / repeat / len(values) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--items", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    for fmt, compression in [("json", "none"), ("json", "zstd"), ("msgpack", "zstd")]:
+        serializer = Serializer(fmt=fmt, compression=compression)
+        values = _cached_values(serializer, args.items)
+        assert json.loads(validated_path(serializer, values)) == json.loads(passthrough_path(serializer, values))
+        before = _per_item_us(validated_path, serializer, values, args.repeat)
+        after = _per_item_us(passthrough_path, serializer, values, args.repeat)
+        print(f"{fmt:>7}/{compression:<4}  validated: {before:7.2f} us/item  passthrough: {after:7.2f} us/item  "
+              f"({before / after:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,7 @@
 import os
+import secrets
+import subprocess
+import sys
 
 wsgi_app = "app.main:app"
 worker_class = "uvicorn.workers.UvicornWorker"
@@ -10,3 +13,42 @@ keepalive = 5
 accesslog = "-"  # consider raising to WARNING in prod via logger config
 errorlog = "-"
 loglevel = os.getenv("LOG_LEVEL", "info")
+
+# CPU copy-on-write sharing: load these models in the master before forking (comma-separated keys)
+_preload_models = [m.strip() for m in os.getenv("PRELOAD_MODELS", "").split(",") if m.strip()]
+preload_app = bool(_preload_models)
+
+
+# Optional dedicated model server (MODEL_SERVER_ENABLED=true): one process owns the models, workers only preprocess
+_model_server = None
+
+
+def on_starting(server):
+    global _model_server
+    if os.getenv("MODEL_SERVER_ENABLED", "false").lower() == "true":
+        # Shared secret for the model-server socket: a configured key, else a fresh one per Gunicorn run.
+        # The server and the workers (forked after this hook) both inherit it through the environment.
+        authkey = os.getenv("MODEL_SERVER_AUTHKEY") or secrets.token_hex(32)
+        os.environ["MODEL_SERVER_AUTHKEY"] = authkey
+        if "app.settings" in sys.modules:
+            # The app was preloaded before this hook; its settings were read without the key
+            sys.modules["app.settings"].settings.MODEL_SERVER_AUTHKEY = authkey
+        server.log.info("Starting model server")
+        _model_server = subprocess.Popen([sys.executable, "-m", "app.services.model_server"])
+    elif _preload_models:
+        from app.services.preload import preload_models
+        preload_models(_preload_models)
+
+
+def post_fork(server, worker):
+    # Split the cores between workers so N workers do not each spin up a full-size intra-op pool
+    if workers > 1:
+        from app.services.preload import cap_worker_threads
+        cap_worker_threads(workers)
+
+
+def on_exit(server):
+    if _model_server is not None:
+        server.log.info("Stopping model server")
+        _model_server.terminate()
+        _model_server.wait(timeout=30)